@@ -0,0 +1,48 @@
+"""
+Один замер в отдельном процессе: время до первой инструкции считается
+от запуска процесса, пиковая память берётся из ru_maxrss.
+"""
+import json
+import os
+import resource
+import sys
+import time
+
+SPAWN_TIME = float(sys.argv[1])
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from mia import Mia  # noqa: E402
+
+
+def main():
+    _, _, filename, memory_size, engine, use_cache, count = sys.argv
+    profile = count == '1'
+
+    mia = Mia(filename, int(memory_size),
+              use_cache=use_cache == '1', engine=engine, profile=profile)
+
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            mia.load()
+            first_instruction = time.time() - SPAWN_TIME
+            start = time.perf_counter()
+            mia.run()
+            run_time = time.perf_counter() - start
+        finally:
+            sys.stdout = stdout
+
+    result = {
+        'first_instruction': first_instruction,
+        'run_time': run_time,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if profile:
+        result['instructions'] = sum(mia.get_profiler().counts)
+    print(json.dumps(result))
+
+
+main()
@@ -0,0 +1,157 @@
+"""
+Набор бенчмарков интерпретатора.
+
+    python benchmarks/run.py                       # все нагрузки, оба движка
+    python benchmarks/run.py --quick               # только минимальные размеры
+    python benchmarks/run.py -w counting_loop -e vm
+    python benchmarks/run.py --compare benchmarks/results/old.json
+
+Для каждой нагрузки и движка сохраняются: число выполненных инструкций,
+инструкций в секунду, время до первой инструкции (от запуска процесса)
+и пиковый RSS. Результаты пишутся в JSON, два файла можно сравнить
+через --compare.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from workloads import WORKLOADS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+CHILD = os.path.join(HERE, 'child.py')
+
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+from mia import Mia  # noqa: E402
+
+
+def measure(filename: str, memory_size: int, engine: str, use_cache: bool, count: bool) -> Dict:
+    args = [
+        sys.executable, CHILD, repr(time.time()),
+        filename, str(memory_size), engine, str(int(use_cache)), str(int(count)),
+    ]
+    out = subprocess.run(args, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def bench(name: str, size: int, engines: List[str], repeat: int, use_cache: bool) -> List[Dict]:
+    gen, _ = WORKLOADS[name]
+    source, memory_size = gen(size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, f'{name}_{size}.mialang')
+        with open(filename, 'w') as f:
+            f.write(source)
+
+        # One profiled run gives the number of executed instructions
+        instructions = measure(filename, memory_size, 'classic', False, True)['instructions']
+        if use_cache:
+            measure(filename, memory_size, 'classic', True, False)  # warm the .miac cache
+
+        rows = []
+        for engine in engines:
+            runs = [measure(filename, memory_size, engine, use_cache, False) for _ in range(repeat)]
+            run_time = statistics.median(k['run_time'] for k in runs)
+            rows.append({
+                'workload': name,
+                'size': size,
+                'engine': engine,
+                'instructions': instructions,
+                'run_time': run_time,
+                'ips': instructions / run_time if run_time else None,
+                'first_instruction': statistics.median(k['first_instruction'] for k in runs),
+                'peak_rss_kb': max(k['peak_rss_kb'] for k in runs),
+            })
+    return rows
+
+
+def key(row: Dict) -> str:
+    return f'{row["workload"]}[{row["size"]}]/{row["engine"]}'
+
+
+def print_rows(rows: List[Dict]):
+    print(f'{"benchmark":<36} {"instr":>10} {"instr/s":>12} {"first, ms":>10} {"rss, MB":>9}')
+    for row in rows:
+        ips = f'{row["ips"]:>12.0f}' if row['ips'] else f'{"-":>12}'
+        print(f'{key(row):<36} {row["instructions"]:>10} {ips} '
+              f'{row["first_instruction"] * 1000:>10.1f} {row["peak_rss_kb"] / 1024:>9.1f}')
+
+
+def print_compare(rows: List[Dict], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {key(k): k for k in json.load(f)['results']}
+
+    print()
+    print(f'compared to {baseline_path}')
+    print(f'{"benchmark":<36} {"instr/s":>10} {"first":>10} {"rss":>10}')
+    for row in rows:
+        old = baseline.get(key(row))
+        if old is None:
+            continue
+
+        def delta(field, higher_is_better=False):
+            if not old.get(field) or not row.get(field):
+                return f'{"-":>10}'
+            change = (row[field] / old[field] - 1) * 100
+            if higher_is_better:
+                change = -change
+            # Positive numbers are regressions for every column
+            return f'{change:>+9.1f}%'
+
+        print(f'{key(row):<36} {delta("ips", True)} {delta("first_instruction")} {delta("peak_rss_kb")}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MiaLang benchmarks')
+    parser.add_argument('-w', '--workload', action='append', choices=sorted(WORKLOADS),
+                        help='run only these workloads (repeatable)')
+    parser.add_argument('-e', '--engine', action='append', choices=Mia.ENGINES,
+                        help='run only these engines (repeatable)')
+    parser.add_argument('--quick', action='store_true', help='only the smallest size of each workload')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cache', action='store_true', help='measure with a warm .miac cache')
+    parser.add_argument('--output', help='results file, default benchmarks/results/<timestamp>.json')
+    parser.add_argument('--compare', metavar='BASELINE', help='print changes against a saved results file')
+    args = parser.parse_args()
+
+    names = args.workload or list(WORKLOADS)
+    engines = args.engine or list(Mia.ENGINES)
+
+    rows = []
+    for name in names:
+        sizes = WORKLOADS[name][1]
+        for size in sizes[:1] if args.quick else sizes:
+            rows.extend(bench(name, size, engines, args.repeat, args.cache))
+
+    print_rows(rows)
+
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(HERE, 'results', f'{stamp}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'version': Mia.V,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cache': args.cache,
+            'repeat': args.repeat,
+            'results': rows,
+        }, f, indent=2)
+    print(f'\nsaved to {output}')
+
+    if args.compare:
+        print_compare(rows, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Проверка времени запуска интерпретатора.
+
+    python benchmarks/startup.py                  # замер и проверка бюджета
+    python benchmarks/startup.py --max-ratio 3.5 --repeat 50
+
+Запускает `main.py` на программе из одной команды вперемешку с пустым
+`python -c pass` и сравнивает лучшие (минимальные) времена: разница -
+цена запуска интерпретатора MiaLang. Минимум не зависит от случайных
+задержек системы, а бюджет задан в долях `python -c pass` на той же
+машине, поэтому не зависит от её скорости и загрузки. Кроме времени
+проверяется, что на обычном пути не импортируются тяжёлые модули
+(NumPy, loguru, ...).
+Код выхода 1 - бюджет превышен или тяжёлый модуль загружен.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+MAIN = os.path.join(ROOT, 'src', 'main.py')
+
+# main.py may take at most this many bare interpreter starts
+MAX_RATIO = 4.5
+
+# Loaded only by the features that need them: arrays, tracing, DEV dumps
+HEAVY_MODULES = ('numpy', 'loguru', 'pprint', 'asyncio', 'multiprocessing', 'json')
+
+PROGRAM = 'alloc 0x1 1\nout 0x1\n'
+
+
+def _env():
+    env = dict(os.environ)
+    # Measure what an installed interpreter does: with .pyc files
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def _time_once(args: List[str], env: Dict[str, str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(args, check=True, stdout=subprocess.DEVNULL, env=env)
+    return time.perf_counter() - start
+
+
+def best_times(commands: List[List[str]], repeat: int) -> List[float]:
+    """
+    Лучшее время каждой команды из `repeat` запусков. Команды
+    чередуются, так что фоновая нагрузка достаётся всем поровну
+    """
+    env = _env()
+    for args in commands:
+        _time_once(args, env)  # warm .pyc and caches
+    best = [float('inf')] * len(commands)
+    for _ in range(repeat):
+        for i, args in enumerate(commands):
+            best[i] = min(best[i], _time_once(args, env))
+    return best
+
+
+def imported_modules(args: List[str]) -> List[str]:
+    # -X importtime lists every module imported, on stderr
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + args,
+        check=True, capture_output=True, text=True, env=_env(),
+    ).stderr
+    modules = []
+    for line in out.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            modules.append(line.rsplit('|', 1)[1].strip())
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MiaLang startup time check')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--max-ratio', type=float, default=MAX_RATIO,
+                        help='allowed best main.py time, in best bare `python -c pass` times')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'startup.mialang')
+        with open(filename, 'w') as f:
+            f.write(PROGRAM)
+        run = [MAIN, filename, 'clear']
+
+        bare, mia = best_times([[sys.executable, '-c', 'pass'], [sys.executable] + run], args.repeat)
+        heavy = [k for k in imported_modules(run) if k.split('.')[0] in HEAVY_MODULES]
+
+    ratio = mia / bare
+    print(f'python -c pass: {bare * 1000:8.1f} ms')
+    print(f'main.py:        {mia * 1000:8.1f} ms')
+    print(f'overhead:       {(mia - bare) * 1000:8.1f} ms')
+    print(f'ratio:          {ratio:8.2f}    (budget {args.max_ratio:.2f})')
+
+    failed = False
+    if ratio > args.max_ratio:
+        print('FAIL: startup overhead is over the budget')
+        failed = True
+    if heavy:
+        print(f'FAIL: heavy modules imported on the plain path: {", ".join(sorted(set(heavy)))}')
+        failed = True
+    if not failed:
+        print('OK')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
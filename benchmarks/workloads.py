@@ -0,0 +1,142 @@
+"""
+Генераторы тестовых программ. Каждый возвращает (исходник, размер памяти),
+размер нагрузки задаётся параметром n.
+"""
+from typing import Callable, Dict, Tuple
+
+Workload = Callable[[int], Tuple[str, int]]
+
+
+def straight_line(n: int) -> Tuple[str, int]:
+    # Long generated program without jumps: front-end dominated
+    lines = ['var 0x1 a 1', 'var 0x2 b 2']
+    body = ['ax a', 'bx b', 'sum 0x3', 'alloc 0x4 7', 'ax 0x3', 'bx 0x4', 'mul 0x5']
+    for i in range(n):
+        lines.append(body[i % len(body)])
+    lines.append('out 0x5')
+    return '\n'.join(lines) + '\n', 100
+
+
+def counting_loop(n: int) -> Tuple[str, int]:
+    # One hot defn/call loop, the shape of factorial.mialang
+    source = f'''
+var 0x1 n    {n}
+var 0x2 acc  0
+var 0x3 i    1
+var 0x4 step 1
+
+defn loop
+    ax  acc
+    bx  i
+    sum acc
+
+    ax  n
+    bx  i
+    sub 0x9
+
+    ax  i
+    bx  step
+    sum i
+
+call loop 0x9
+out acc
+'''
+    return source, 100
+
+
+def nested_loops(n: int) -> Tuple[str, int]:
+    # n outer iterations of a 10-step inner loop
+    source = f'''
+var 0x1 n     {n}
+var 0x2 i     0
+var 0x3 j     0
+var 0x4 step  1
+var 0x5 inner 10
+var 0x6 zero  0
+var 0x7 acc   0
+
+defn outer
+    ax  zero
+    bx  zero
+    sum j
+
+    defn inner_loop
+        ax  acc
+        bx  step
+        sum acc
+
+        ax  j
+        bx  step
+        sum j
+
+        ax  inner
+        bx  j
+        sub 0x9
+    call inner_loop 0x9
+
+    ax  i
+    bx  step
+    sum i
+
+    ax  n
+    bx  i
+    sub 0xa
+call outer 0xa
+out acc
+'''
+    return source, 100
+
+
+def array_fill_loop(n: int) -> Tuple[str, int]:
+    # Element-by-element fill, as in fill_array.mialang
+    source = f'''
+var 0x1 i    0
+var 0x2 n    {n}
+var 0x3 step 1
+
+array 0x4 arr {n}
+arxn arr
+
+defn push_item
+    arxi i
+    push i
+
+    ax i
+    bx step
+    sum i
+
+    ax n
+    bx i
+    sub 0x20
+call push_item 0x20
+out _arxv
+'''
+    return source, 100
+
+
+def array_bulk(n: int) -> Tuple[str, int]:
+    # Large allocation plus vectorized commands
+    source = f'''
+array 0x4 arr {n}
+var 0x1 s 0
+arange arr 0 1
+amul arr 3
+asum arr s
+out s
+'''
+    return source, 100
+
+
+def memory_size(n: int) -> Tuple[str, int]:
+    # Cost of allocating a big memory; the program only touches one cell
+    return f'alloc {hex(n // 2 - 1)} 1\nout {hex(n // 2 - 1)}\n', n
+
+
+WORKLOADS: Dict[str, Tuple[Workload, Tuple[int, ...]]] = {
+    'straight_line': (straight_line, (1_000, 10_000, 100_000)),
+    'counting_loop': (counting_loop, (1_000, 10_000, 100_000)),
+    'nested_loops': (nested_loops, (100, 1_000)),
+    'array_fill_loop': (array_fill_loop, (1_000, 10_000)),
+    'array_bulk': (array_bulk, (10_000, 1_000_000)),
+    'memory_size': (memory_size, (100, 10_000, 1_000_000, 10_000_000)),
+}
@@ -0,0 +1,172 @@
+"""
+Пакетный запуск: много программ (или одна программа с разными
+начальными значениями) в пуле процессов, отчёт в JSON/CSV
+
+    python batch.py ../*.mialang --json report.json
+    python batch.py ../factorial.mialang --seeds seeds.json --jobs 4 --csv report.csv
+
+seeds.json - список начальных состояний:
+    [{"memory": {"n": 5}, "registers": {"ax": 1}}, {"memory": {"0x1": 7}}, ...]
+
+Ячейки - по адресу или имени. Если программа сама инициализирует
+ячейку, значение заменяет литерал первой её `alloc`/`var`
+(см. `program.Program.start`)
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import errors
+import program
+from mia import Mia
+
+
+EXIT_OK = 0
+EXIT_PROGRAM_ERROR = 1
+EXIT_CRASH = 2
+
+# Each worker compiles a file once, however many seeds it runs
+_programs: Dict[str, program.Program] = {}
+
+
+def _get_program(path: str) -> program.Program:
+    prog = _programs.get(path)
+    if prog is None:
+        prog = _programs[path] = program.compile_file(path)
+    return prog
+
+
+def _parse_memory(memory: Dict[str, float]) -> Dict[Union[int, str], float]:
+    # JSON keys are strings: '0x1' or '1' for an address, a name otherwise
+    return {int(k, 0) if k[:1].isdecimal() else k: v for k, v in memory.items()}
+
+
+def run_job(index: int, path: str, seed_index: Optional[int], seed: Optional[Dict],
+            memory_size: int, engine: str, fixed_width: bool = False) -> Dict:
+    row = {
+        'index': index,
+        'file': path,
+        'seed': seed_index,
+        'exit_code': EXIT_OK,
+        'error': None,
+        'output': [],
+    }
+    start = time.perf_counter()
+    try:
+        seed = seed or {}
+        result = _get_program(path).run(
+            memory_size,
+            memory=_parse_memory(seed.get('memory', {})),
+            registers=seed.get('registers'),
+            engine=engine,
+            fixed_width=fixed_width,
+        )
+        row['output'] = result.output
+    except errors.ProgramError as e:
+        row['exit_code'] = EXIT_PROGRAM_ERROR
+        row['error'] = str(e)
+    except Exception as e:
+        row['exit_code'] = EXIT_CRASH
+        row['error'] = f'{type(e).__name__}: {e}'
+    row['time'] = time.perf_counter() - start
+    return row
+
+
+def iter_jobs(paths: List[str], seeds: Optional[List[Dict]]) -> Iterator[Tuple]:
+    index = 0
+    for path in paths:
+        if seeds is None:
+            yield index, path, None, None
+            index += 1
+            continue
+        for seed_index, seed in enumerate(seeds):
+            yield index, path, seed_index, seed
+            index += 1
+
+
+def run_batch(paths: List[str],
+              seeds: Optional[List[Dict]] = None,
+              jobs: Optional[int] = None,
+              memory_size: int = 100,
+              engine: str = 'classic',
+              order: str = 'input',
+              fixed_width: bool = False) -> List[Dict]:
+    """
+    `order='input'` - строки отчёта в порядке заданий,
+    `order='completion'` - в порядке завершения
+    """
+    rows = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(run_job, *job, memory_size, engine, fixed_width)
+            for job in iter_jobs(paths, seeds)
+        ]
+        for future in as_completed(futures):
+            rows.append(future.result())
+    if order == 'input':
+        rows.sort(key=lambda k: k['index'])
+    return rows
+
+
+def write_json(rows: List[Dict], path: str):
+    with open(path, 'w') as f:
+        json.dump(rows, f, indent=2, ensure_ascii=False)
+
+
+def write_csv(rows: List[Dict], path: str):
+    fields = ['index', 'file', 'seed', 'exit_code', 'time', 'output', 'error']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**row, 'output': '\n'.join(row['output'])})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MiaLang batch runner')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--seeds', metavar='PATH',
+                        help='JSON list of initial states, every file runs once per state')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(),
+                        help='worker processes, all cores by default')
+    parser.add_argument('--order', choices=['input', 'completion'], default='input',
+                        help='order of the report rows')
+    parser.add_argument('--memory-size', type=int, default=100)
+    parser.add_argument('--engine', choices=Mia.ENGINES, default='classic')
+    parser.add_argument('--fixed-width', action='store_true',
+                        help='int64/float64 numbers, as in main.py')
+    parser.add_argument('--json', metavar='PATH', help='write the report as JSON')
+    parser.add_argument('--csv', metavar='PATH', help='write the report as CSV')
+    args = parser.parse_args()
+
+    seeds = None
+    if args.seeds:
+        with open(args.seeds) as f:
+            seeds = json.load(f)
+
+    start = time.perf_counter()
+    rows = run_batch(args.files, seeds, args.jobs, args.memory_size, args.engine, args.order,
+                     args.fixed_width)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        write_json(rows, args.json)
+    if args.csv:
+        write_csv(rows, args.csv)
+
+    failed = [k for k in rows if k['exit_code'] != EXIT_OK]
+    for row in failed:
+        # The report heading names the error kind, e.g. `=== KEYWORD_ERROR === on Line 2`
+        lines = [k for k in (row['error'] or '').splitlines() if 'ERROR' in k] or [row['error']]
+        print(f'FAIL {row["file"]} seed={row["seed"]}: {lines[0]}')
+    print(f'{len(rows)} runs, {len(failed)} failed, {elapsed:.2f}s')
+    sys.exit(EXIT_OK if not failed else EXIT_PROGRAM_ERROR)
+
+
+if __name__ == '__main__':
+    main()
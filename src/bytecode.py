@@ -0,0 +1,208 @@
+from array import array
+import hashlib
+import os
+import struct
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import commands as cmd
+import utils
+from lexer import Operand
+
+
+MAGIC = b'MIAC'
+CACHE_EXT = '.miac'
+# Bump whenever the file layout or the meaning of the instructions changes
+FORMAT = 4
+
+_HEADER = struct.Struct('<4sHB')
+_COUNT = struct.Struct('<I')
+_CONST = struct.Struct('<BI')
+_INT64 = struct.Struct('<q')
+_FLOAT64 = struct.Struct('<d')
+
+# Constant kinds: literals are parsed once, when the cache is written
+_RAW = 0  # names and literals that do not fit: parsed on load
+_ADDRESS = 1
+_INT = 2
+_FLOAT = 3
+
+_INT64_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+class Instr(NamedTuple):
+    op: int
+    line: int
+    col: int
+    args: Tuple[Operand, ...]
+
+
+def source_digest(source: bytes) -> bytes:
+    return hashlib.sha256(source).digest()
+
+
+def cache_path(filename: str) -> str:
+    return os.path.splitext(filename)[0] + CACHE_EXT
+
+
+def _pack_u32(values: Iterable[int]) -> bytes:
+    a = array('I', values)
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a.tobytes()
+
+
+def _unpack_u32(data: bytes, offset: int, n: int) -> array:
+    chunk = data[offset:offset + 4 * n]
+    if len(chunk) != 4 * n:
+        raise struct.error('truncated cache')
+    a = array('I')
+    a.frombytes(chunk)
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a
+
+
+def _pack_const(arg: Operand) -> bytes:
+    data = arg.string.encode()
+    if arg.address is not None and arg.address in _INT64_RANGE:
+        return _CONST.pack(_ADDRESS, len(data)) + data + _INT64.pack(arg.address)
+    if type(arg.number) is int and arg.number in _INT64_RANGE:
+        return _CONST.pack(_INT, len(data)) + data + _INT64.pack(arg.number)
+    if type(arg.number) is float:
+        return _CONST.pack(_FLOAT, len(data)) + data + _FLOAT64.pack(arg.number)
+    return _CONST.pack(_RAW, len(data)) + data
+
+
+def _unpack_const(data: bytes, offset: int) -> Tuple[Operand, int]:
+    kind, size = _CONST.unpack_from(data, offset)
+    offset += _CONST.size
+    # Interned: every command that reads the constant shares one string
+    s = sys.intern(data[offset:offset + size].decode())
+    offset += size
+    if kind == _ADDRESS:
+        return Operand(s, _INT64.unpack_from(data, offset)[0], None), offset + _INT64.size
+    if kind == _INT:
+        return Operand(s, None, _INT64.unpack_from(data, offset)[0]), offset + _INT64.size
+    if kind == _FLOAT:
+        return Operand(s, None, _FLOAT64.unpack_from(data, offset)[0]), offset + _FLOAT64.size
+    return utils.to_operand(s), offset
+
+
+def encode(instrs: List[Instr], version: str, digest: bytes) -> bytes:
+    """
+    Формат: заголовок (MAGIC, версия формата, версия, хэш исходника),
+    пул констант (строка аргумента и её разобранное значение: адрес
+    или число) и инструкции по столбцам: opcode, argc, line, col
+    и номера констант всех аргументов подряд
+    """
+    pool: Dict[str, int] = {}
+    consts = bytearray()
+    args: List[int] = []
+
+    for instr in instrs:
+        for arg in instr.args:
+            index = pool.get(arg.string)
+            if index is None:
+                index = pool[arg.string] = len(pool)
+                consts += _pack_const(arg)
+            args.append(index)
+
+    v = version.encode()
+    out = bytearray(_HEADER.pack(MAGIC, FORMAT, len(v)))
+    out += v
+    out += digest
+
+    out += _COUNT.pack(len(pool))
+    out += consts
+
+    out += _COUNT.pack(len(instrs))
+    out += bytes(k.op for k in instrs)
+    out += bytes(len(k.args) for k in instrs)
+    out += _pack_u32(k.line for k in instrs)
+    out += _pack_u32(k.col for k in instrs)
+    out += _COUNT.pack(len(args))
+    out += _pack_u32(args)
+    return bytes(out)
+
+
+def decode(data: bytes, version: str, digest: bytes) -> Optional[List[Instr]]:
+    """
+    Возвращает None, если кэш собран другой версией
+    интерпретатора или для другого исходника
+    """
+    magic, fmt, v_len = _HEADER.unpack_from(data, 0)
+    offset = _HEADER.size
+    if magic != MAGIC or fmt != FORMAT:
+        return None
+    if data[offset:offset + v_len] != version.encode():
+        return None
+    offset += v_len
+    if data[offset:offset + len(digest)] != digest:
+        return None
+    offset += len(digest)
+
+    (n_consts,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    pool: List[Operand] = []
+    for _ in range(n_consts):
+        const, offset = _unpack_const(data, offset)
+        pool.append(const)
+
+    (n_instrs,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    ops = data[offset:offset + n_instrs]
+    offset += n_instrs
+    argcs = data[offset:offset + n_instrs]
+    offset += n_instrs
+    if len(argcs) != n_instrs or max(ops, default=0) >= len(cmd.CmdEnum):
+        return None
+    lines = _unpack_u32(data, offset, n_instrs)
+    offset += 4 * n_instrs
+    cols = _unpack_u32(data, offset, n_instrs)
+    offset += 4 * n_instrs
+
+    (n_args,) = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    args = [pool[k] for k in _unpack_u32(data, offset, n_args)]
+
+    operands: List[Tuple[Operand, ...]] = []
+    end = 0
+    for argc in argcs:
+        start, end = end, end + argc
+        operands.append(tuple(args[start:end]))
+    if end != n_args:
+        return None
+    return list(map(Instr._make, zip(ops, lines, cols, operands)))
+
+
+def read_cache(filename: str, version: str, digest: bytes) -> Optional[List[Instr]]:
+    try:
+        with open(cache_path(filename), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        return decode(data, version, digest)
+    except (struct.error, UnicodeDecodeError, IndexError):
+        return None
+
+
+def write_cache(filename: str, instrs: List[Instr], version: str, digest: bytes):
+    path = cache_path(filename)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(encode(instrs, version, digest))
+        os.replace(tmp, path)
+    except (OSError, struct.error, OverflowError, ValueError):
+        # The cache is an optimization only: a read-only directory or
+        # a program the format cannot hold must not stop it from running.
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def opcode(name: str) -> int:
+    return cmd.CmdEnum[name].value
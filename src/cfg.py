@@ -0,0 +1,185 @@
+"""
+Граф потока управления программы, собранный до запуска.
+
+Базовый блок начинается с первой команды, с каждого `defn` и с команды
+после каждого `call`; внутри блока команды идут подряд. Из блока,
+который кончается `call`, два перехода: дальше по программе и на метку.
+Переход на `defn` продолжает выполнение со следующей команды.
+
+Метка, определённая один раз, известна до запуска: `call` получает
+номер команды и прыгает без поиска по имени, в том числе вперёд.
+Метка с несколькими `defn` остаётся за поиском во время выполнения -
+прыгают на тот `defn`, что выполнился последним.
+"""
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+
+import commands as cmd
+
+
+def resolve_label(labels: Dict[str, List[int]], name: str) -> Optional[int]:
+    """
+    Номер `defn` для метки, определённой один раз, иначе None.
+    `labels` - метка -> номера её `defn` (`ControlFlowGraph.labels`
+    или первый проход потокового режима)
+    """
+    indexes = labels.get(name, [])
+    if len(indexes) == 1:
+        return indexes[0]
+    return None
+
+
+class BasicBlock:
+    """
+    Команды `start` ... `end - 1`, `successors` - номера блоков
+    """
+
+    __slots__ = ('index', 'start', 'end', 'label', 'successors')
+
+    def __init__(self, index: int, start: int, end: int, label: Optional[str]):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.label = label  # `defn` at `start`, None otherwise
+        self.successors: List[int] = []
+
+    def __repr__(self):
+        return f'BasicBlock({self.index}, {self.start}..{self.end}, {self.label!r}, {self.successors})'
+
+
+class ControlFlowGraph:
+    def __init__(self, commands: List[cmd.MiaCommand]):
+        self._n = len(commands)
+        self._lines = [com._t_cmd.line for com in commands]
+        # Names are read from the tokens: the graph is built before `bind()`
+        self.labels: Dict[str, List[int]] = {}
+        self.calls: Dict[int, str] = {}
+        for i, com in enumerate(commands):
+            if isinstance(com, cmd.DefNameCmd):
+                self.labels.setdefault(com._t_arg1.string, []).append(i)
+            elif isinstance(com, cmd.CallDefNameCmd):
+                self.calls[i] = com._t_arg1.string
+
+        self.blocks: List[BasicBlock] = []
+        self._block_of: List[int] = [0] * self._n
+        self._split(commands)
+        self._link()
+
+    def _split(self, commands: List[cmd.MiaCommand]):
+        leaders = {0}
+        for indexes in self.labels.values():
+            leaders.update(indexes)
+        leaders.update(i + 1 for i in self.calls)
+        starts = sorted(k for k in leaders if k < self._n)
+
+        for k, start in enumerate(starts):
+            end = starts[k + 1] if k + 1 < len(starts) else self._n
+            com = commands[start]
+            label = com._t_arg1.string if isinstance(com, cmd.DefNameCmd) else None
+            self.blocks.append(BasicBlock(k, start, end, label))
+            self._block_of[start:end] = [k] * (end - start)
+
+    def _resume(self, index: int) -> Optional[int]:
+        # Block that runs after command `index`, None past the end
+        return self._block_of[index + 1] if index + 1 < self._n else None
+
+    def _link(self):
+        for block in self.blocks:
+            last = block.end - 1
+            targets = []
+            if block.end < self._n:
+                targets.append(self._block_of[block.end])
+            if last in self.calls:
+                # Every `defn` of the name: the last executed one wins at run time
+                for k in self.labels.get(self.calls[last], []):
+                    targets.append(self._resume(k))
+            for k in targets:
+                if k is not None and k not in block.successors:
+                    block.successors.append(k)
+
+    def entry_points(self) -> List[int]:
+        """
+        Команды, с которых может начаться выполнение: начало программы
+        и команда после каждого `defn`
+        """
+        starts = {0}
+        for indexes in self.labels.values():
+            starts.update(i + 1 for i in indexes)
+        return sorted(k for k in starts if k < self._n)
+
+    def reachable(self) -> Set[int]:
+        if not self.blocks:
+            return set()
+        seen = {0}
+        queue = deque([0])
+        while queue:
+            for k in self.blocks[queue.popleft()].successors:
+                if k not in seen:
+                    seen.add(k)
+                    queue.append(k)
+        return seen
+
+    def dead_blocks(self) -> List[BasicBlock]:
+        """
+        Блоки, до которых не доходит ни один путь от начала программы.
+        Пока все `call` условные, каждый блок достижим хотя бы по
+        проходу сверху вниз
+        """
+        seen = self.reachable()
+        return [k for k in self.blocks if k.index not in seen]
+
+    def back_edges(self) -> List[Tuple[int, int]]:
+        """
+        Пары (`call`, `defn`) с переходом назад - кандидаты в циклы
+        """
+        return [
+            (i, k)
+            for i, name in sorted(self.calls.items())
+            for k in self.labels.get(name, [])
+            if k <= i
+        ]
+
+    def unused_labels(self) -> List[Tuple[int, str]]:
+        """
+        `defn`, на которые нет ни одного `call`
+        """
+        called = set(self.calls.values())
+        return [
+            (i, name)
+            for name, indexes in self.labels.items() if name not in called
+            for i in indexes
+        ]
+
+    def unresolved_calls(self) -> List[Tuple[int, str]]:
+        """
+        `call` на метку без единого `defn`: упадёт, если переход случится
+        """
+        return [(i, name) for i, name in sorted(self.calls.items()) if name not in self.labels]
+
+    def _lines_of(self, start: int, end: int) -> str:
+        first, last = self._lines[start], self._lines[end - 1]
+        return str(first) if first == last else f'{first}-{last}'
+
+    def print_report(self):
+        dead = {k.index for k in self.dead_blocks()}
+
+        print('====================|CFG|====================')
+        print(f'{"block":>5} {"lines":<12} {"label":<20} {"cmds":>5}  successors')
+        for block in self.blocks:
+            mark = '  dead' if block.index in dead else ''
+            successors = ', '.join(map(str, block.successors)) or '-'
+            print(f'{block.index:>5} {self._lines_of(block.start, block.end):<12} '
+                  f'{block.label or "":<20} {block.end - block.start:>5}  {successors}{mark}')
+        print()
+        for i, k in self.back_edges():
+            print(f'loop: line {self._lines[i]} call -> line {self._lines[k]} defn')
+        for i, name in self.unresolved_calls():
+            print(f'unresolved: line {self._lines[i]} call {name}')
+        for i, name in sorted(self.unused_labels()):
+            print(f'unused: line {self._lines[i]} defn {name}')
+        print(f'blocks: {len(self.blocks)}, dead: {len(dead)}')
+        print('=============================================')
+
+
+def build(commands: List[cmd.MiaCommand]) -> ControlFlowGraph:
+    return ControlFlowGraph(commands)
@@ -1,21 +1,18 @@
-from enum import Enum
 import enum
-from pprint import pformat, pprint
-from typing import Dict, List, Optional
-import numpy as np
-import tokenize
-from tokenize import NEWLINE, ENDMARKER, TokenInfo
+from typing import List, Optional
 
 from abc import ABC, abstractmethod 
-  
-from loguru import logger
 
 import mia
+import mem
 import errors
 import utils
+from lexer import Token
 
 
 class MiaCommand(ABC):
+    __slots__ = ('_t_cmd', '_t_arg1', '_t_arg2', '_t_arg3', '_mia', '_cmd_index')
+    
     ARG1_REQUERED = False
     ARG2_REQUERED = False
     ARG3_REQUERED = False
@@ -24,15 +21,15 @@ class MiaCommand(ABC):
     
     def __init__(self, 
                  mia: 'mia.Mia', 
-                 t_cmd: TokenInfo, 
-                 t_arg1: Optional[TokenInfo], 
-                 t_arg2: Optional[TokenInfo], 
-                 t_arg3: Optional[TokenInfo], 
+                 t_cmd: Token, 
+                 t_arg1: Optional[Token], 
+                 t_arg2: Optional[Token], 
+                 t_arg3: Optional[Token], 
                  cmd_index: int):
-        self._t_cmd: TokenInfo = t_cmd
-        self._t_arg1: Optional[TokenInfo] = t_arg1
-        self._t_arg2: Optional[TokenInfo] = t_arg2
-        self._t_arg3: Optional[TokenInfo] = t_arg3
+        self._t_cmd: Token = t_cmd
+        self._t_arg1: Optional[Token] = t_arg1
+        self._t_arg2: Optional[Token] = t_arg2
+        self._t_arg3: Optional[Token] = t_arg3
         self._mia = mia
         self._cmd_index = cmd_index
         
@@ -53,6 +50,16 @@ class MiaCommand(ABC):
     def do(self):
         pass
     
+    def bind(self):
+        """
+        Разрешает аргументы команды один раз, до начала выполнения
+        """
+        pass
+    
+    def release_tokens(self):
+        # After bind() only the command token is needed (for error positions)
+        self._t_arg1 = self._t_arg2 = self._t_arg3 = None
+    
     @abstractmethod
     def parse_value(self):
         pass
@@ -61,16 +68,26 @@ class MiaCommand(ABC):
     def repr_doc(cls):
         return cls.__doc__.replace('`', '').replace('-\n','\n')
 
-    def parse_ref(self, t: TokenInfo):
+    def parse_ref(self, t: Token) -> 'mem.Ref':
         if utils.is_hex_ref(t):
-            return utils.to_ref(t)
+            # Addresses are literals: checked once here, not on every access
+            return self._mia.check_address(utils.to_address(t), self._t_cmd)
         return t.string
     
+    def bind_operand(self, t: Token):
+        """
+        Число-литерал или значение по адресу / имени
+        """
+        try:
+            return utils.constant(utils.to_number_value(t))
+        except ValueError:
+            return self._mia.bind_source(self.parse_ref(t))
+    
     def factory(mia, 
-                t_cmd: TokenInfo, 
-                arg1: Optional[TokenInfo], 
-                arg2: Optional[TokenInfo], 
-                arg3: Optional[TokenInfo], 
+                t_cmd: Token, 
+                arg1: Optional[Token], 
+                arg2: Optional[Token], 
+                arg3: Optional[Token], 
                 cmd_index: int) -> 'MiaCommand':
         key = CmdEnum[t_cmd.string]
         com: MiaCommand = CMD_MAPPING.get(key)
@@ -86,19 +103,24 @@ class AllocCmd(MiaCommand):
     >>> alloc 0x1 5
     """
     
+    __slots__ = ('_ref', '_dst', '_value')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = True
     
-    def parse_value(self, t: TokenInfo):
+    def parse_value(self, t: Token):
         return utils.to_number_value(t)
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._dst = self._mia.bind_target(self._ref)
+        self._value = self.parse_value(self._t_arg2)
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
-        val = self.parse_value(self._t_arg2)
         try:
-            self._mia.set_to_buffer(ref, val)
+            self._dst(self._value)
         except errors.AssociatedAddressError:
-            self._mia.print_assoc_address_error(self._t_cmd, ref)
+            self._mia.print_assoc_address_error(self._t_cmd, self._ref)
     
 
 class OutCmd(MiaCommand):
@@ -110,16 +132,20 @@ class OutCmd(MiaCommand):
     >>> out 0x1
     """
     
+    __slots__ = ('_ref', '_src')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._src = self._mia.bind_source(self._ref)
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
-        val = self._mia.get_from_buffer(ref)
-        self._mia.print_val(val)
+        self._mia.print_val(self._src())
         
 
 class OutFCmd(MiaCommand):
@@ -130,16 +156,22 @@ class OutFCmd(MiaCommand):
     -
     >>> outf 0x1
     """
+    
+    __slots__ = ('_ref', '_label', '_src')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._label = hex(self._ref) if isinstance(self._ref, int) else self._ref
+        self._src = self._mia.bind_source(self._ref)
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
-        val = self._mia.get_from_buffer(ref)
-        self._mia.print_ref_val(ref, val)
+        self._mia.print_ref_val(self._label, self._src())
         
         
 class RegAxCmd(MiaCommand):
@@ -150,17 +182,21 @@ class RegAxCmd(MiaCommand):
     -
     >>> ax 0x1
     """
+    
+    __slots__ = ('_ref', '_src')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._src = self._mia.bind_source(self._ref)
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
-        val = self._mia.get_from_buffer(ref)
-        
-        self._mia.reg_ax(val)
+        self._mia.reg_ax(self._src())
         
 
 class RegBxCmd(MiaCommand):
@@ -172,17 +208,20 @@ class RegBxCmd(MiaCommand):
     >>> bx 0x1
     """
     
+    __slots__ = ('_ref', '_src')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._src = self._mia.bind_source(self._ref)
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
-        val = self._mia.get_from_buffer(ref)
-        
-        self._mia.reg_bx(val)
+        self._mia.reg_bx(self._src())
         
         
 class SumCmd(MiaCommand):
@@ -192,18 +231,21 @@ class SumCmd(MiaCommand):
     >>> sum 0x1
     """
     
+    __slots__ = ('_ref', '_dst')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._dst = self._mia.bind_target(self._ref)
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
         self._mia.sum_registers()
-        
-        val = self._mia.get_rx()
-        self._mia.set_to_buffer(ref, val)
+        self._dst(self._mia.get_rx())
         
 
 class SubCmd(MiaCommand):
@@ -213,18 +255,21 @@ class SubCmd(MiaCommand):
     >>> sub 0x1
     """
     
+    __slots__ = ('_ref', '_dst')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._dst = self._mia.bind_target(self._ref)
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
         self._mia.sub_registers()
-        
-        val = self._mia.get_rx()
-        self._mia.set_to_buffer(ref, val)
+        self._dst(self._mia.get_rx())
         
         
 class MulCmd(MiaCommand):
@@ -234,18 +279,21 @@ class MulCmd(MiaCommand):
     >>> mul 0x1
     """
     
+    __slots__ = ('_ref', '_dst')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._dst = self._mia.bind_target(self._ref)
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
         self._mia.mul_registers()
-        
-        val = self._mia.get_rx()
-        self._mia.set_to_buffer(ref, val)
+        self._dst(self._mia.get_rx())
         
         
 class DivCmd(MiaCommand):
@@ -255,18 +303,21 @@ class DivCmd(MiaCommand):
     >>> div 0x1
     """
     
+    __slots__ = ('_ref', '_dst')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._dst = self._mia.bind_target(self._ref)
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
         self._mia.div_registers()
-        
-        val = self._mia.get_rx()
-        self._mia.set_to_buffer(ref, val)
+        self._dst(self._mia.get_rx())
         
 
 class DefNameCmd(MiaCommand):
@@ -276,15 +327,19 @@ class DefNameCmd(MiaCommand):
     >>> defn foo
     """
     
+    __slots__ = ('_name',)
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._name = self._t_arg1.string
+    
     def do(self):
-        name = self._t_arg1.string
-        self._mia.define_name(name, self._cmd_index)
+        self._mia.define_name(self._name, self._cmd_index)
         
         
 class CallDefNameCmd(MiaCommand):
@@ -294,19 +349,27 @@ class CallDefNameCmd(MiaCommand):
     >>> call foo
     """
     
+    __slots__ = ('_name', '_target', '_ref', '_src')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._name = self._t_arg1.string
+        self._target = self._mia.resolve_def_name(self._name)
+        self._ref = None
+        self._src = None
+        if self._t_arg2 is not None:
+            self._ref = self.parse_ref(self._t_arg2)
+            self._src = self._mia.bind_source(self._ref)
+    
     def do(self):
-        name = self._t_arg1.string
-        if self._t_arg2 is None:
-            return self._mia.call_if_rx(name)
-        ref = self.parse_ref(self._t_arg2)
-        val = self._mia.get_from_buffer(ref)
-        self._mia.call_if_val(name, val)
+        if self._src is None:
+            return self._mia.call_if_rx(self._name, self._target)
+        self._mia.call_if_val(self._name, self._src(), self._target)
              
 
 class AssocCmd(MiaCommand):
@@ -316,16 +379,20 @@ class AssocCmd(MiaCommand):
     >>> assoc 0x1 a
     """
     
+    __slots__ = ('_ref', '_name')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = True
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._name = self._t_arg2.string
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
-        name = self._t_arg2.string
-        self._mia.create_assoc(ref, name)
+        self._mia.create_assoc(self._ref, self._name)
         
 
 class VarCmd(MiaCommand):
@@ -335,16 +402,19 @@ class VarCmd(MiaCommand):
     >>> var 0x1 a 10
     """
     
-    def parse_value(self, t: TokenInfo):
+    __slots__ = ('_ref', '_name', '_value')
+    
+    def parse_value(self, t: Token):
         return utils.to_number_value(t)
     
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._name = self._t_arg2.string
+        self._value = self.parse_value(self._t_arg3)
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
-        name = self._t_arg2.string
-        value = self.parse_value(self._t_arg3)
-        
-        self._mia.create_assoc(ref, name)
-        self._mia.set_to_buffer(name, value)
+        self._mia.create_assoc(self._ref, self._name)
+        self._mia.set_to_buffer(self._name, self._value)
         
 
 class ArrayCmd(MiaCommand):
@@ -354,6 +424,8 @@ class ArrayCmd(MiaCommand):
     >>> array 0x1 arr 2
     """
     
+    __slots__ = ('_ref', '_name', '_length')
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = True
     ARG3_REQUERED = True
@@ -361,58 +433,65 @@ class ArrayCmd(MiaCommand):
     def parse_value(self, t):
         return utils.to_number_value(t)
 
-    def do(self):
-        ref = self.parse_ref(self._t_arg1)
-        name = self._t_arg2.string
-        length = self.parse_value(self._t_arg3)
+    def bind(self):
+        self._ref = self.parse_ref(self._t_arg1)
+        self._name = self._t_arg2.string
+        self._length = int(self.parse_value(self._t_arg3))
 
-        self._mia.create_array(ref, name, length)
+    def do(self):
+        self._mia.create_array(self._ref, self._name, self._length)
         
         
 class RegArxnCmd(MiaCommand):
     """
-    Задать значение для регистра BX по адресу из памяти
+    Выбрать массив для команд arxi / push (регистр ARXN)
     
     `arxn <array_name>`
     -
     >>> arxn arr
     """
     
+    __slots__ = ('_name',)
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        self._name = self.parse_ref(self._t_arg1)
+    
     def do(self):
-        name = self.parse_ref(self._t_arg1)
-        self._mia.reg_arxn(name)
+        self._mia.reg_arxn(self._name)
         
         
 class RegArxiCmd(MiaCommand):
     """
-    Задать значение для регистра BX по адресу из памяти
+    Задать индекс элемента массива (регистр ARXI),
+    значение _arxn[_arxi] попадает в регистр ARXV
     
     `arxi <index>`
     -
     >>> arxi 10
     """
     
+    __slots__ = ('_src',)
+    
     ARG1_REQUERED = True
     ARG2_REQUERED = False
     
     def parse_value(self):
         return super().parse_value()
     
+    def bind(self):
+        if self._t_arg1.string.isdecimal():
+            self._src = utils.constant(int(self._t_arg1.string))
+        else:
+            self._src = self._mia.bind_source(self.parse_ref(self._t_arg1))
+    
     def do(self):
-        ref = self.parse_ref(self._t_arg1)
-        try:
-            val = self._mia.get_from_buffer(ref)
-        except KeyError:
-            if ref.isdecimal():
-                val = int(ref)
-        
-        self._mia.reg_arxi(val)
+        self._mia.reg_arxi(self._src(), self._t_cmd)
         
         
 class PushToArrayItemCmd(MiaCommand):
@@ -424,22 +503,197 @@ class PushToArrayItemCmd(MiaCommand):
     >>> push 10 
     """
     
+    __slots__ = ('_src',)
+    
     def parse_value(self, t):
         return utils.to_number_value(t)
     
+    def bind(self):
+        self._src = self.bind_operand(self._t_arg1)
+    
     def do(self):
-        try:
-            val = self.parse_value(self._t_arg1)
-        except ValueError:
-            val = self._mia.get_from_buffer(self._t_arg1.string)
-        self._mia.push_value_to_array_item(val)
+        self._mia.push_value_to_array_item(self._src(), self._t_cmd)
        
         
+class ArrayBulkCmd(MiaCommand):
+    """
+    Операция над всем массивом за один вызов NumPy
+    """
+    
+    __slots__ = ('_array',)
+    
+    ARG1_REQUERED = True
+    ARG2_REQUERED = True
+    
+    def parse_value(self):
+        return super().parse_value()
+    
+    def bind(self):
+        self._array = self._mia.bind_source(self.parse_ref(self._t_arg1))
+        
+    def get_array(self, src=None) -> 'mem.ArrayRef':
+        return self._mia.as_array((src or self._array)(), self._t_cmd)
+    
+    def get_nonempty_array(self) -> 'mem.ArrayRef':
+        return self._mia.as_nonempty_array(self._array(), self._t_cmd)
+    
+    def get_operand(self, array_ref: 'mem.ArrayRef', src):
+        return self._mia.as_array_operand(array_ref, src(), self._t_cmd)
+    
+    
+class ArrayFillCmd(ArrayBulkCmd):
+    """
+    Заполнить массив одним значением
+    
+    `afill <array_name> <value>`
+    -
+    >>> afill arr 0
+    """
+    
+    __slots__ = ('_src',)
+    
+    def bind(self):
+        super().bind()
+        self._src = self.bind_operand(self._t_arg2)
+    
+    def do(self):
+        self.get_array().fill(self._src())
+        
+
+class ArrayRangeCmd(ArrayBulkCmd):
+    """
+    Заполнить массив значениями start, start + step, ...
+    
+    `arange <array_name> <start> <step>`
+    -
+    >>> arange arr 0 1
+    """
+    
+    __slots__ = ('_start', '_step')
+    
+    ARG3_REQUERED = True
+    
+    def bind(self):
+        super().bind()
+        self._start = self.bind_operand(self._t_arg2)
+        self._step = self.bind_operand(self._t_arg3)
+    
+    def do(self):
+        self.get_array().fill_range(self._start(), self._step())
+        
+        
+class ArrayAddCmd(ArrayBulkCmd):
+    """
+    Прибавить к каждому элементу число или элементы другого массива
+    
+    `aadd <array_name> <value|array_name>`
+    -
+    >>> aadd arr 10
+    """
+    
+    __slots__ = ('_src',)
+    
+    def bind(self):
+        super().bind()
+        self._src = self.bind_operand(self._t_arg2)
+    
+    def do(self):
+        array_ref = self.get_array()
+        array_ref.add(self.get_operand(array_ref, self._src))
+        
+        
+class ArrayMulCmd(ArrayBulkCmd):
+    """
+    Умножить каждый элемент на число или на элементы другого массива
+    
+    `amul <array_name> <value|array_name>`
+    -
+    >>> amul arr 2
+    """
+    
+    __slots__ = ('_src',)
+    
+    def bind(self):
+        super().bind()
+        self._src = self.bind_operand(self._t_arg2)
+    
+    def do(self):
+        array_ref = self.get_array()
+        array_ref.mul(self.get_operand(array_ref, self._src))
+        
+        
+class ArraySumCmd(ArrayBulkCmd):
+    """
+    `asum <array_name> -> <ref>`
+    -
+    >>> asum arr 0x1
+    """
+    
+    __slots__ = ('_ref', '_dst')
+    
+    def bind(self):
+        super().bind()
+        self._ref = self.parse_ref(self._t_arg2)
+        self._dst = self._mia.bind_target(self._ref)
+    
+    def do(self):
+        self._dst(self.get_array().sum())
+        
+        
+class ArrayMinCmd(ArraySumCmd):
+    """
+    `amin <array_name> -> <ref>`
+    -
+    >>> amin arr 0x1
+    """
+    
+    __slots__ = ()
+    
+    def do(self):
+        self._dst(self.get_nonempty_array().min())
+        
+        
+class ArrayMaxCmd(ArraySumCmd):
+    """
+    `amax <array_name> -> <ref>`
+    -
+    >>> amax arr 0x1
+    """
+    
+    __slots__ = ()
+    
+    def do(self):
+        self._dst(self.get_nonempty_array().max())
+        
+        
+class ArrayCopyCmd(ArrayBulkCmd):
+    """
+    Скопировать элементы одного массива в другой. Массивы разной
+    длины копируются на длину короткого: лишние элементы источника
+    отбрасываются, хвост приёмника остаётся как был
+    
+    `acopy <src_array_name> <dst_array_name>`
+    -
+    >>> acopy arr arr2
+    """
+    
+    __slots__ = ('_dst_array',)
+    
+    def bind(self):
+        super().bind()
+        self._dst_array = self._mia.bind_source(self.parse_ref(self._t_arg2))
+    
+    def do(self):
+        self.get_array(self._dst_array).copy_from(self.get_array())
+        
+        
 class DEV_OutBufCmd(MiaCommand):
     """
     DEV_out_buf
     """
     
+    __slots__ = ()
+    
     ARG1_REQUERED = False
     ARG2_REQUERED = False
     ARG3_REQUERED = False
@@ -456,6 +710,8 @@ class DEV_OutAssocBufCmd(MiaCommand):
     DEV_out_assoc_buf
     """
     
+    __slots__ = ()
+    
     ARG1_REQUERED = False
     ARG2_REQUERED = False
     ARG3_REQUERED = False
@@ -467,6 +723,62 @@ class DEV_OutAssocBufCmd(MiaCommand):
         self._mia.print_assoc_buf()
         
 
+class FusedArithCmd(MiaCommand):
+    """
+    Суперинструкция `ax <a>` `bx <b>` `sum|sub|mul|div <ref>`,
+    собирается оптимизатором (peephole), в исходнике не пишется
+    """
+    
+    __slots__ = ('_ax_cmd', '_bx_cmd', '_op_cmd', '_ax_src', '_bx_src', '_op', '_ref', '_dst')
+    
+    OPERATIONS = {
+        SumCmd: 'sum_registers',
+        SubCmd: 'sub_registers',
+        MulCmd: 'mul_registers',
+        DivCmd: 'div_registers',
+    }
+    
+    def __init__(self, 
+                 mia: 'mia.Mia', 
+                 t_cmd: Token, 
+                 ax_cmd: Optional[RegAxCmd], 
+                 bx_cmd: Optional[RegBxCmd], 
+                 op_cmd: MiaCommand, 
+                 cmd_index: int):
+        super().__init__(mia, t_cmd, None, None, None, cmd_index)
+        self._ax_cmd = ax_cmd
+        self._bx_cmd = bx_cmd
+        self._op_cmd = op_cmd
+    
+    def parse_value(self):
+        return super().parse_value()
+    
+    def parts(self) -> List[MiaCommand]:
+        return [k for k in (self._ax_cmd, self._bx_cmd, self._op_cmd) if k is not None]
+    
+    def bind(self):
+        for com in self.parts():
+            com.bind()
+        self._ax_src = self._ax_cmd._src if self._ax_cmd is not None else None
+        self._bx_src = self._bx_cmd._src if self._bx_cmd is not None else None
+        self._op = getattr(self._mia, self.OPERATIONS[type(self._op_cmd)])
+        self._ref = self._op_cmd._ref
+        self._dst = self._op_cmd._dst
+        
+    def release_tokens(self):
+        for com in self.parts():
+            com.release_tokens()
+    
+    def do(self):
+        # Registers are still written: later code may read them
+        if self._ax_src is not None:
+            self._mia.reg_ax(self._ax_src())
+        if self._bx_src is not None:
+            self._mia.reg_bx(self._bx_src())
+        self._op()
+        self._dst(self._mia.get_rx())
+
+
 class CmdEnum(enum.Enum):
     alloc = 0
     out = enum.auto()
@@ -488,6 +800,15 @@ class CmdEnum(enum.Enum):
     
     DEV_out_buf = enum.auto()
     DEV_out_assoc_buf = enum.auto()
+    
+    afill = enum.auto()
+    arange = enum.auto()
+    aadd = enum.auto()
+    amul = enum.auto()
+    asum = enum.auto()
+    amin = enum.auto()
+    amax = enum.auto()
+    acopy = enum.auto()
 
     
 CMD_MAPPING = {
@@ -511,4 +832,17 @@ CMD_MAPPING = {
     
     CmdEnum.DEV_out_buf: DEV_OutBufCmd,
     CmdEnum.DEV_out_assoc_buf: DEV_OutAssocBufCmd,
-} 
\ No newline at end of file
+    
+    CmdEnum.afill: ArrayFillCmd,
+    CmdEnum.arange: ArrayRangeCmd,
+    CmdEnum.aadd: ArrayAddCmd,
+    CmdEnum.amul: ArrayMulCmd,
+    CmdEnum.asum: ArraySumCmd,
+    CmdEnum.amin: ArrayMinCmd,
+    CmdEnum.amax: ArrayMaxCmd,
+    CmdEnum.acopy: ArrayCopyCmd,
+}
+
+# By opcode (`CmdEnum` value): the bytecode loader skips the name lookup
+OPCODE_CLASSES = [CMD_MAPPING[k] for k in CmdEnum]
+OPCODE_NAMES = [k.name for k in CmdEnum]
@@ -1,2 +1,17 @@
 class AssociatedAddressError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class ProgramError(Exception):
+    """
+    Ошибка в программе, запущенной через `program.Program`.
+    Текст исключения - тот же отчёт, что печатается в консоль
+    """
+    pass
+
+
+class SnapshotError(Exception):
+    """
+    Снимок состояния не подходит к запускаемой программе
+    """
+    pass
@@ -0,0 +1,162 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+import commands as cmd
+import mem
+import mia
+
+
+HOT_THRESHOLD = 64
+
+_LOCAL_REGISTERS = {'_ax': 'ax', '_bx': 'bx', '_rx': 'rx'}
+
+_OPERATORS = {
+    cmd.SumCmd: '+',
+    cmd.SubCmd: '-',
+    cmd.MulCmd: '*',
+    cmd.DivCmd: '/',
+}
+
+# Operators whose result goes through `wrap` with --fixed-width
+_WRAPPED = (cmd.SumCmd, cmd.SubCmd, cmd.MulCmd)
+
+
+class Unsupported(Exception):
+    pass
+
+
+class HotLoop:
+    """
+    Тело цикла `defn` ... `call`, собранное в функцию на Python
+    с заранее найденными номерами ячеек. Годится, пока не изменилась
+    эпоха памяти (новые `assoc`/`var`/`array`)
+    """
+
+    def __init__(self, mia: 'mia.Mia', commands: List[cmd.MiaCommand], start: int, call_index: int):
+        self._mia = mia
+        self._memory: mem.Memory = mia._memory
+        self.start = start
+        self._epoch = self._memory.get_epoch()
+        self._namespace: Dict[str, object] = {
+            'cells': self._memory.get_cells(),
+            'print_val': mia.print_val,
+            'print_ref_val': mia.print_ref_val,
+            'wrap': mem.wrap_int64,
+        }
+        self._func: Callable = self._compile(commands, start, call_index)
+
+    def is_valid(self) -> bool:
+        return self._memory.get_epoch() == self._epoch
+
+    def _read(self, ref: Optional[mem.Ref]) -> str:
+        if isinstance(ref, str) and ref in _LOCAL_REGISTERS:
+            return _LOCAL_REGISTERS[ref]
+        if isinstance(ref, str) and self._mia._is_register_name(ref):
+            return f'm.{ref}'
+        return f'cells[{self._cell(ref)}]'
+
+    def _cell(self, ref: Optional[mem.Ref]) -> int:
+        cell = self._memory.resolve_cell(ref)
+        if cell is None:
+            raise Unsupported(ref)  # owned cell or an array: keep the generic path
+        return cell
+
+    def _arith(self, t: type) -> str:
+        if self._mia._fixed_width and t in _WRAPPED:
+            return f'rx = wrap(ax {_OPERATORS[t]} bx)'
+        return f'rx = ax {_OPERATORS[t]} bx'
+
+    def _translate(self, i: int, com: cmd.MiaCommand) -> List[str]:
+        t = type(com)
+
+        if t is cmd.RegAxCmd:
+            return [f'ax = {self._read(com._ref)}']
+        if t is cmd.RegBxCmd:
+            return [f'bx = {self._read(com._ref)}']
+        if t in _OPERATORS:
+            return [self._arith(t), f'cells[{self._cell(com._ref)}] = rx']
+        if t is cmd.FusedArithCmd:
+            lines = []
+            if com._ax_cmd is not None:
+                lines.append(f'ax = {self._read(com._ax_cmd._ref)}')
+            if com._bx_cmd is not None:
+                lines.append(f'bx = {self._read(com._bx_cmd._ref)}')
+            return lines + [self._arith(type(com._op_cmd)), f'cells[{self._cell(com._ref)}] = rx']
+        if t is cmd.OutCmd:
+            return [f'print_val({self._read(com._ref)})']
+        if t is cmd.OutFCmd:
+            self._namespace[f'l{i}'] = com._label
+            return [f'print_ref_val(l{i}, {self._read(com._ref)})']
+        if t is cmd.AllocCmd:
+            self._namespace[f'v{i}'] = com._value
+            return [f'cells[{self._cell(com._ref)}] = v{i}']
+        # Jumps, new names and array registers change what the loop relies on
+        raise Unsupported(com)
+
+    def _compile(self, commands: List[cmd.MiaCommand], start: int, call_index: int) -> Callable:
+        call = commands[call_index]
+        cond = 'rx' if call._ref is None else self._read(call._ref)
+        self._namespace['m'] = self._mia
+
+        out = [
+            'def _hot_loop(ax, bx, rx):',
+            '    while True:',
+        ]
+        for i in range(start, call_index):
+            out += [f'        {line}' for line in self._translate(i, commands[i])]
+        out += [
+            f'        if not {cond} > 0:',
+            '            return ax, bx, rx',
+            '',
+        ]
+        exec(compile('\n'.join(out), '<mia hot loop>', 'exec'), self._namespace)
+        return self._namespace['_hot_loop']
+
+    def run(self) -> Tuple:
+        m = self._mia
+        return self._func(m._ax, m._bx, m._rx)
+
+
+class LoopSpecializer:
+    """
+    Считает обратные переходы `call` -> `defn`. Когда цикл становится
+    горячим, его тело собирается в HotLoop и дальше выполняется им
+    """
+
+    def __init__(self, mia: 'mia.Mia', commands: List[cmd.MiaCommand], threshold: int = HOT_THRESHOLD):
+        self._mia = mia
+        self._commands = commands
+        self._threshold = threshold
+        self._counts: Dict[int, int] = {}
+        # call index -> loop, None when the body cannot be specialized
+        self._loops: Dict[int, Optional[HotLoop]] = {}
+
+    def _get_loop(self, call_index: int, start: int) -> Optional[HotLoop]:
+        loop = self._loops.get(call_index)
+        if loop is not None and loop.is_valid() and loop.start == start:
+            return loop
+        if call_index in self._loops and loop is None:
+            return None
+        try:
+            loop = HotLoop(self._mia, self._commands, start, call_index)
+        except Unsupported:
+            loop = None
+        self._loops[call_index] = loop
+        return loop
+
+    def on_back_edge(self, call_index: int):
+        """
+        Вызывается после перехода назад: `_cmd_index` уже стоит на `defn`
+        """
+        count = self._counts.get(call_index, 0) + 1
+        self._counts[call_index] = count
+        if count < self._threshold:
+            return
+
+        m = self._mia
+        loop = self._get_loop(call_index, m._cmd_index + 1)
+        if loop is None:
+            return
+        # The loop runs until its `call` falls through, so execution
+        # continues right after the `call`
+        m._ax, m._bx, m._rx = loop.run()
+        m._cmd_index = call_index
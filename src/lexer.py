@@ -0,0 +1,123 @@
+from array import array
+import io
+import sys
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+
+COMMENT = '//'
+
+
+class Token(NamedTuple):
+    string: str
+    line: int  # line numbers start from 1
+    col: int
+
+
+class Operand(NamedTuple):
+    """
+    Аргумент, разобранный при компиляции (см. `bytecode`): один объект
+    на все вхождения строки, позиция ошибки - по токену команды
+    """
+    string: str
+    address: Optional[int]  # `0x..` literal
+    number: Optional[Union[int, float]]  # numeric literal
+
+
+def lex_line(text: str, i_line: int) -> List[Token]:
+    cut = text.find(COMMENT)
+    if cut != -1:
+        text = text[:cut]
+    
+    tokens = []
+    col = 0
+    for word in text.split():
+        col = text.find(word, col)
+        # Names and addresses repeat on many lines: keep one copy of each
+        tokens.append(Token(sys.intern(word), i_line, col))
+        col += len(word)
+    return tokens
+
+
+def lex_lines(lines: Iterable[str], first_line: int = 1) -> Iterator[List[Token]]:
+    """
+    Разбивает исходник на строки вида `<cmd> <arg>*`,
+    пропуская пустые строки и комментарии `//`
+    """
+    for i_line, text in enumerate(lines, first_line):
+        line = lex_line(text, i_line)
+        if line:
+            yield line
+
+
+def lex(source: bytes) -> Iterator[List[Token]]:
+    # Split on '\n' only, so line numbers match the offsets in SourceMap
+    return lex_lines(source.decode('utf-8-sig').split('\n'))
+
+
+class SourceMap:
+    """
+    Смещения начала каждой строки в файле исходника.
+    Строки читаются с диска только для вывода ошибок
+    """
+
+    def __init__(self, filename: str, offsets: 'array[int]', source: Optional[bytes] = None):
+        self._filename = filename
+        self._offsets = offsets
+        self._source = source  # only for programs that have no file
+
+    @classmethod
+    def from_source(cls, filename: str, source: bytes, keep: bool = False) -> 'SourceMap':
+        offsets = array('Q', [0])
+        find = source.find
+        i = find(b'\n')
+        while i != -1:
+            offsets.append(i + 1)
+            i = find(b'\n', i + 1)
+        if len(offsets) > 1 and offsets[-1] == len(source):
+            offsets.pop()  # no line after the final newline
+        return cls(filename, offsets, source if keep else None)
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'SourceMap':
+        offsets = array('Q')
+        pos = 0
+        with open(filename, 'rb') as f:
+            for data in f:
+                offsets.append(pos)
+                pos += len(data)
+        return cls(filename, offsets)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _open(self) -> BinaryIO:
+        if self._source is not None:
+            return io.BytesIO(self._source)
+        return open(self._filename, 'rb')
+
+    def lines(self, first: int, last: int) -> Iterator[Tuple[int, str]]:
+        """
+        Строки с номерами `first`..`last` включительно
+        """
+        first = max(first, 1)
+        if first > last or not self._offsets:
+            return
+        # The map may still be growing (an error during the streaming scan):
+        # past its end, read on from the last known line
+        start = min(first, len(self._offsets))
+        with self._open() as f:
+            f.seek(self._offsets[start - 1])
+            for i_line in range(start, last + 1):
+                data = f.readline()
+                if not data:
+                    return
+                if i_line < first:
+                    continue
+                if i_line == 1 and data.startswith(b'\xef\xbb\xbf'):
+                    data = data[3:]
+                yield i_line, data.decode('utf-8').rstrip('\r\n')
+
+    def line(self, i_line: int) -> str:
+        for _, text in self.lines(i_line, i_line):
+            return text
+        return ''
@@ -1,13 +1,144 @@
 import sys
+from types import SimpleNamespace
 
-from loguru import logger
 from mia import Mia
 
 
-if len(sys.argv) > 2:
-    if sys.argv[2] == 'clear':
-        logger.remove()
+# Option defaults, shared by argparse and the plain invocation
+DEFAULTS = {
+    'memory_size': 100,
+    'no_cache': False,
+    'engine': 'classic',
+    'profile': False,
+    'profile_json': None,
+    'no_opt': False,
+    'no_hot_loops': False,
+    'stream': False,
+    'error_context': Mia.ERROR_CONTEXT,
+    'output': None,
+    'line_buffered': False,
+    'mem_report': False,
+    'checkpoint': None,
+    'checkpoint_every': Mia.CHECKPOINT_EVERY,
+    'resume': None,
+    'memory_file': None,
+    'fixed_width': False,
+    'cfg': False,
+}
 
 
-mia = Mia(sys.argv[1], 100)
-mia.main()
+def parse_args() -> 'argparse.Namespace':
+    # Imported here: with the parser setup it costs more than the rest of the startup
+    import argparse
+
+    parser = argparse.ArgumentParser(description='MiaLang interpreter')
+    parser.add_argument('filename')
+    parser.add_argument('mode', nargs='?', choices=['clear'])
+    parser.add_argument('--memory-size', type=int,
+                        help='memory size, the program gets half as many cells')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read or write the .miac bytecode cache')
+    parser.add_argument('--engine', choices=Mia.ENGINES,
+                        help='execution engine: command objects, the opcode VM '
+                             'or the program compiled to Python code')
+    parser.add_argument('--profile', action='store_true',
+                        help='count and time every command on the classic engine, '
+                             'print a hot-spot report at exit')
+    parser.add_argument('--profile-json', metavar='PATH',
+                        help='write the profile report as JSON (implies --profile)')
+    parser.add_argument('--no-opt', action='store_true',
+                        help='do not fuse ax/bx/arithmetic sequences into superinstructions')
+    parser.add_argument('--no-hot-loops', action='store_true',
+                        help='do not specialize hot loops on the classic engine')
+    parser.add_argument('--stream', action='store_true',
+                        help='read and compile the program while it runs, '
+                             'keeping only a window of commands in memory')
+    parser.add_argument('--error-context', type=int, metavar='N',
+                        help='source lines shown around an error, -1 for the whole file')
+    parser.add_argument('--output', metavar='PATH',
+                        help='write the out/outf output to a file instead of stdout')
+    parser.add_argument('--line-buffered', action='store_true',
+                        help='flush the output after every line (default when stdout is a terminal)')
+    parser.add_argument('--mem-report', action='store_true',
+                        help='print the interpreter memory footprint at exit')
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help='write a snapshot of the whole interpreter state every '
+                             '--checkpoint-every commands (classic engine)')
+    parser.add_argument('--checkpoint-every', type=int, metavar='N')
+    parser.add_argument('--resume', metavar='PATH',
+                        help='continue a run from a snapshot written by --checkpoint')
+    parser.add_argument('--memory-file', metavar='PATH',
+                        help='keep the memory cells in a memory-mapped file; an existing file '
+                             'is opened with its size, names and arrays')
+    parser.add_argument('--fixed-width', action='store_true',
+                        help='int64/float64 numbers: integer results wrap around instead of '
+                             'growing, arrays skip the overflow checks')
+    parser.add_argument('--cfg', action='store_true',
+                        help='print the control-flow graph: basic blocks, loops, dead blocks '
+                             'and calls to undefined labels, without running the program')
+    parser.set_defaults(**DEFAULTS)
+    args = parser.parse_args()
+
+    if (args.profile or args.profile_json) and args.engine != 'classic':
+        parser.error('--profile works only with the classic engine')
+    if args.stream and (args.engine != 'classic' or args.profile or args.profile_json):
+        parser.error('--stream works only with the classic engine and without profiling')
+    if args.checkpoint and (args.engine != 'classic' or args.profile or args.profile_json or args.stream):
+        parser.error('--checkpoint works only with the classic engine, without profiling and streaming')
+    if args.checkpoint_every <= 0:
+        parser.error('--checkpoint-every must be positive')
+    if args.resume and args.stream:
+        parser.error('--resume does not work with --stream')
+    if args.memory_file and (args.checkpoint or args.resume):
+        parser.error('--memory-file already persists the memory, it does not work with --checkpoint/--resume')
+    if args.cfg and args.stream:
+        parser.error('--cfg needs the whole program, it does not work with --stream')
+    return args
+
+
+def is_plain(argv) -> bool:
+    # `main.py <file>` or `main.py <file> clear`: nothing for argparse to do
+    return len(argv) in (1, 2) and not argv[0].startswith('-') and argv[1:] in ([], ['clear'])
+
+
+if is_plain(sys.argv[1:]):
+    args = SimpleNamespace(filename=sys.argv[1], mode=(sys.argv[2:] or [None])[0], **DEFAULTS)
+else:
+    args = parse_args()
+
+
+mia = Mia(args.filename, 
+          args.memory_size, 
+          use_cache=not args.no_cache, 
+          engine=args.engine, 
+          trace=args.mode != 'clear',
+          profile=args.profile or args.profile_json is not None,
+          stream=args.stream,
+          error_context=args.error_context,
+          optimize=not args.no_opt,
+          hot_loops=not args.no_hot_loops,
+          output_path=args.output,
+          line_buffered=True if args.line_buffered else None,
+          checkpoint=args.checkpoint,
+          checkpoint_every=args.checkpoint_every,
+          resume=args.resume,
+          memory_path=args.memory_file,
+          fixed_width=args.fixed_width)
+try:
+    if args.cfg:
+        mia.load()
+        mia.get_cfg().print_report()
+    else:
+        mia.main()
+finally:
+    mia.close_output()
+    mia.close_memory()
+    prof = mia.get_profiler()
+    if prof is not None:
+        if args.profile_json:
+            prof.write_json(args.profile_json)
+        else:
+            prof.print_report()
+
+if args.mem_report:
+    mia.print_memory_report()
@@ -0,0 +1,274 @@
+"""
+Память в отображённом файле: ячейки фиксированной ширины
+(int64/float64 и байт типа) пишутся прямо в файл, имена и массивы -
+в индекс рядом с ним. Следующий запуск или другой процесс видит
+результаты без экспорта:
+
+    memory = mapped.open_memory('data.miam')
+    memory.get_value('total')
+
+Файл:
+    заголовок (MAGIC, версия формата, число ячеек), 64 байта
+    kinds   uint8[n]   - 0: пусто, 1: int, 2: float, 3: большое целое
+    values  8 байт[n]  - int64 или float64 в порядке байт машины
+Индекс: <файл>.json (имена и целые больше 64 бит),
+массивы: <файл>.arrays/<номер>.npy
+"""
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+import errors
+import mem
+
+
+MAGIC = b'MIAM'
+FORMAT = 1
+
+_HEADER = struct.Struct('<4sHQ')
+_HEADER_SIZE = 64
+_ALIGN = 8
+
+KIND_NONE = 0
+KIND_INT = 1
+KIND_FLOAT = 2
+KIND_BIG = 3  # past int64, the value lives in the index
+
+
+def _layout(n: int) -> Tuple[int, int]:
+    values = _HEADER_SIZE + n
+    values += -values % _ALIGN
+    return values, values + 8 * n
+
+
+class MappedCells:
+    """
+    Ячейки поверх mmap с интерфейсом списка:
+    `cells[i]` читает и пишет файл напрямую
+    """
+
+    __slots__ = ('_buf', '_kinds', '_ints', '_floats', '_big', '_n')
+
+    def __init__(self, buf: mmap.mmap, n: int):
+        values, end = _layout(n)
+        view = memoryview(buf)
+        self._buf = buf
+        self._n = n
+        self._kinds = view[_HEADER_SIZE:_HEADER_SIZE + n]
+        # Two typed views of the same bytes, the kind byte tells which one is live
+        self._ints = view[values:end].cast('q')
+        self._floats = view[values:end].cast('d')
+        self._big: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __iter__(self) -> Iterator[Union[int, float, None]]:
+        for i in range(self._n):
+            yield self[i]
+
+    def __getitem__(self, i: int) -> Union[int, float, None]:
+        kind = self._kinds[i]
+        if kind == KIND_INT:
+            return self._ints[i]
+        if kind == KIND_FLOAT:
+            return self._floats[i]
+        if kind == KIND_BIG:
+            return self._big[i]
+        return None
+
+    def __setitem__(self, i: int, val: Union[int, float, None]):
+        t = type(val)
+        if t is int:
+            try:
+                self._ints[i] = val
+                self._kinds[i] = KIND_INT
+            except ValueError:
+                self._big[i] = val
+                self._kinds[i] = KIND_BIG
+        elif t is float:
+            self._floats[i] = val
+            self._kinds[i] = KIND_FLOAT
+        elif val is None:
+            self._kinds[i] = KIND_NONE
+        else:
+            raise TypeError(f'{hex(i)}: cannot store {t.__name__} in a cell')
+
+    def get_big(self) -> Dict[int, int]:
+        # Cells overwritten since keep a stale entry, drop those
+        return {i: v for i, v in self._big.items() if self._kinds[i] == KIND_BIG}
+
+    def set_big(self, big: Dict[int, int]):
+        self._big = big
+
+    def flush(self):
+        self._buf.flush()
+
+    def release(self):
+        self._kinds.release()
+        self._ints.release()
+        self._floats.release()
+        self._buf.close()
+
+
+def _create_file(path: str, n: int):
+    _, end = _layout(n)
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT, n))
+        f.truncate(end)  # sparse: untouched cells cost no disk space
+
+
+def _open_file(path: str) -> Tuple[mmap.mmap, int]:
+    with open(path, 'r+b') as f:
+        magic, fmt, n = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError(f'{path}: not a memory file of this format')
+        return mmap.mmap(f.fileno(), _layout(n)[1]), n
+
+
+class MappedMemory(mem.Memory):
+    """
+    Memory с ячейками в файле `path`. Существующий файл открывается
+    со своим размером и своими именами, новый создаётся на `size / 2` ячеек
+    """
+
+    def __init__(self, size: int, path: str, fixed_width: bool = False):
+        self._path = path
+        self._index_path = path + '.json'
+        self._arrays_dir = path + '.arrays'
+        self._array_files: Dict[mem.ArrayRef, Tuple[str, Optional[np.ndarray]]] = {}
+        self._next_array = 0
+        super().__init__(size, fixed_width)
+
+    def fill_memory(self):
+        if not os.path.exists(self._path):
+            _create_file(self._path, self._Memory__size // 2)
+            self._write_index()
+        buf, n = _open_file(self._path)
+        self._Memory__size = n * 2
+        self._Memory__cells = MappedCells(buf, n)
+        self._read_index()
+
+    def _array_path(self, number: int) -> str:
+        return os.path.join(self._arrays_dir, f'{number}.npy')
+
+    def _make_array(self, ref: int, name: str, length: int) -> mem.ArrayRef:
+        os.makedirs(self._arrays_dir, exist_ok=True)
+        path = self._array_path(self._next_array)
+        self._next_array += 1
+        values = np.lib.format.open_memmap(path, 'w+', np.int64, (length,))
+        array = mem.ArrayRef.from_values(ref, name, values, self.is_fixed_width())
+        self._array_files[array] = (path, values)
+        return array
+
+    def _sync_array(self, array: mem.ArrayRef) -> Dict:
+        path, mapped = self._array_files[array]
+        values = array._values
+        if values is mapped:
+            mapped.flush()
+            return {'file': os.path.basename(path)}
+        if values.dtype.kind == 'O':
+            # Big ints have no fixed-width form
+            self._array_files[array] = (path, None)
+            return {'list': values.tolist()}
+        # A promotion or a bulk operation replaced the buffer: map the new one
+        np.save(path, values)
+        mapped = np.lib.format.open_memmap(path, 'r+')
+        array._values = mapped
+        self._array_files[array] = (path, mapped)
+        return {'file': os.path.basename(path)}
+
+    def _write_index(self):
+        cells, symbols, refs, arrays = self.get_state()
+        owners = []
+        ids: Dict[int, int] = {}
+
+        def add(owner: mem.AssocRef) -> int:
+            key = id(owner)
+            if key not in ids:
+                ids[key] = len(owners)
+                desc = {'ref': owner._ref, 'name': owner._name}
+                if isinstance(owner, mem.ArrayRef):
+                    desc.update(self._sync_array(owner))
+                owners.append(desc)
+            return ids[key]
+
+        index = {
+            'symbols': symbols,
+            'refs': {str(ref): add(owner) for ref, owner in refs.items()},
+            'arrays': {name: add(array) for name, array in arrays.items()},
+            'owners': owners,
+            'next_array': self._next_array,
+            'big': {str(i): v for i, v in cells.get_big().items()} if isinstance(cells, MappedCells) else {},
+        }
+        tmp = f'{self._index_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, self._index_path)
+
+        # Arrays nothing refers to any more
+        live = {k.get('file') for k in owners}
+        if os.path.isdir(self._arrays_dir):
+            for name in os.listdir(self._arrays_dir):
+                if name not in live:
+                    os.remove(os.path.join(self._arrays_dir, name))
+
+    def _read_owner(self, desc: Dict) -> mem.AssocRef:
+        if 'file' in desc:
+            path = os.path.join(self._arrays_dir, desc['file'])
+            values = np.lib.format.open_memmap(path, 'r+')
+        elif 'list' in desc:
+            path = self._array_path(self._next_array)
+            self._next_array += 1
+            values = np.array(desc['list'], dtype=object)
+        else:
+            return mem.AssocRef(desc['ref'], desc['name'], self._Memory__cells)
+        array = mem.ArrayRef.from_values(desc['ref'], desc['name'], values, self.is_fixed_width())
+        self._array_files[array] = (path, values if 'file' in desc else None)
+        return array
+
+    def _read_index(self):
+        if not os.path.exists(self._index_path):
+            return  # the run that created the file never closed it
+        with open(self._index_path) as f:
+            index = json.load(f)
+        self._next_array = index['next_array']
+        self._Memory__cells.set_big({int(i): v for i, v in index['big'].items()})
+        owners = [self._read_owner(k) for k in index['owners']]
+        self._Memory__symbols = index['symbols']
+        self._Memory__refs = {int(ref): owners[i] for ref, i in index['refs'].items()}
+        self._Memory__arrays = {name: owners[i] for name, i in index['arrays'].items()}
+        self._Memory__epoch += 1
+
+    def set_state(self, *args, **kwargs):
+        # A snapshot holds a plain list of cells, the file is the state here
+        raise errors.SnapshotError(f'{self._path}: a memory file cannot be restored from a snapshot')
+
+    def sync(self):
+        """
+        Записать индекс и сбросить страницы на диск,
+        после этого файл можно читать из другого процесса
+        """
+        self._write_index()
+        self._Memory__cells.flush()
+
+    def close(self):
+        self.sync()
+        self._Memory__cells.release()
+
+
+class TracedMappedMemory(mem.TracedMemory, MappedMemory):
+    pass
+
+
+def open_memory(path: str) -> MappedMemory:
+    """
+    Открыть память, оставленную программой (`--memory-file`)
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    return MappedMemory(2, path)
@@ -1,147 +1,394 @@
-from pprint import pformat, pprint
-from typing import Dict, List, Union
-import numpy as np
-from queue import LifoQueue
-import tokenize
-from tokenize import NEWLINE, ENDMARKER, TokenInfo
-
-from abc import ABC, abstractmethod 
-  
-from loguru import logger
+import sys
+from typing import Dict, List, Optional, Union
+
 import errors
-import commands as cmd
+import utils
+
+
+np = utils.LazyImport('numpy')
+logger = utils.LazyImport('loguru', 'logger')
+
+
+Ref = Union[int, str]  # cell address or associated name
 
 
 class AssocRef:
-    def __init__(self, ref: str, name: str):
+    __slots__ = ('_ref', '_name', '_cells')
+    
+    def __init__(self, ref: int, name: str, cells: List):
         self._ref = ref
         self._name = name
-        self._value = None
+        self._cells = cells
         
     def __repr__(self) -> str:
-        return f'{self.__class__}<ref={self._ref} name={self._name} value={self._value}>'
+        return f'{self.__class__}<ref={hex(self._ref)} name={self._name} value={self.get_value()}>'
         
     def set_value(self, val):
-        self._value = val
+        self._cells[self._ref] = val
         
     def get_value(self):
-        return self._value
-    
+        return self._cells[self._ref]
     
-class ArrayItem:
-    def __init__(self, array_ref: 'ArrayRef', ref: str, index: int):
-        self._array_ref = array_ref
-        self._ref = ref
-        self._index = index
-        self._value = None
-        
-    def __repr__(self) -> str:
-        return f'{self.__class__}<ref={self._ref} index={self._index} value={self._value} array_ref={self._array_ref._name}>'
-        
-    def set_value(self, value):
-        self._value = value
-        
-    def get_value(self):
-        return self._value
     
-    def reg_me(self):
-        self._array_ref.reg_array_item(self)
-        
-    def get_ref(self) -> str:
-        return self._ref
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+FLOAT64_EXACT_INT = 2 ** 53
+
+
+def wrap_int64(val):
+    """
+    Целое вне int64 заворачивается по модулю 2**64, как в машинной арифметике
+    """
+    if type(val) is int and not INT64_MIN <= val <= INT64_MAX:
+        return (val - INT64_MIN) % 2 ** 64 + INT64_MIN
+    return val
 
 
 class ArrayRef(AssocRef):
-    def __init__(self, ref: str, name: str, length: int):
-        super().__init__(ref, name)
+    """
+    Массив хранит элементы в непрерывном буфере NumPy: int64, пока
+    в него пишут только целые, float64 после первого дробного значения
+    и object, если значение не помещается в машинный тип.
+    
+    С `fixed=True` буфер не выходит за int64/float64: целые
+    заворачиваются по модулю 2**64 без проверок переполнения
+    """
+    
+    __slots__ = ('_length', '_values', '_fixed', '_bound')
+    
+    def __init__(self, ref: int, name: str, length: int, fixed: bool = False):
+        super().__init__(ref, name, None)
         self._length = length
+        self._fixed = fixed
         
-        self._array_values: List[ArrayItem] = []
+        self._values = np.zeros(length, dtype=np.int64)
+        self._bound = 0  # upper bound of abs() over the values, None: unknown
         
-    def reg_array_item(self, item: ArrayItem):
-        self._array_values.append(item)
-
-    def get_item_generator(self):
-        start = int(self._ref, 16)
-        for i, k in enumerate(range(start, start + self._length + 1, 1)):
-            yield ArrayItem(self, hex(k), i)
+    def __repr__(self) -> str:
+        return f'{self.__class__}<ref={hex(self._ref)} name={self._name} value={self._values}>'
+    
+    @classmethod
+    def from_values(cls, ref: int, name: str, values: 'np.ndarray', fixed: bool = False) -> 'ArrayRef':
+        array = cls.__new__(cls)
+        AssocRef.__init__(array, ref, name, None)
+        array._length = len(values)
+        array._values = values
+        array._fixed = fixed
+        array._bound = None
+        return array
+    
+    def _fits(self, value) -> bool:
+        kind = self._values.dtype.kind
+        if kind == 'O':
+            return True
+        if type(value) is int:
+            if kind == 'i':
+                return INT64_MIN <= value <= INT64_MAX
+            # The fixed width takes the nearest float64 over an exact object
+            return self._fixed or -FLOAT64_EXACT_INT <= value <= FLOAT64_EXACT_INT
+        return type(value) is float and kind == 'f'
+    
+    def _promote(self, value):
+        if type(value) is float and self._values.dtype.kind == 'i':
+            self._values = self._values.astype(np.float64)
+        else:
+            self._values = self._values.astype(object)
         
     def set_value(self, index, value):
-        pass
+        if not 0 <= index < self._length:
+            raise IndexError(f'{self._name}[{index}]')
+        if self._fixed:
+            value = wrap_int64(value)
+        if not self._fits(value):
+            self._promote(value)
+        self._values[index] = value
+        if self._bound is not None and not -self._bound <= value <= self._bound:
+            self._bound = abs(value)
     
     def get_value(self, index=None):
         if index is None:
-            return [k.get_value() for k in self._array_values] 
+            return self._values.tolist()
+        if not 0 <= index < self._length:
+            raise IndexError(f'{self._name}[{index}]')
+        return self._values.item(index)
+    
+    # Bulk operations. Each one is a single NumPy call over the buffer;
+    # int64 results that could overflow are computed on Python ints instead.
+    # The overflow guard compares cached bounds and rescans the buffer
+    # only when the cheap check fails.
+    
+    def _magnitude(self) -> Union[int, float]:
+        if self._bound is None:
+            if self._length == 0:
+                self._bound = 0
+            else:
+                self._bound = max(abs(_scalar(self._values.min())), abs(_scalar(self._values.max())))
+        return self._bound
+    
+    def _operand(self, other: Union['ArrayRef', int, float]):
+        if isinstance(other, ArrayRef):
+            if other._length != self._length:
+                raise ValueError(f'{self._name}: length {self._length} != {other._name}: length {other._length}')
+            return other._values
+        return other
+    
+    def _result_bound(self, other: Union['ArrayRef', int, float], bound) -> Optional[Union[int, float]]:
+        # Bound of the result if it fits in int64, None if it may overflow
+        def check():
+            other_bound = other._magnitude() if isinstance(other, ArrayRef) else abs(other)
+            result = bound(self._magnitude(), other_bound)
+            return None if result > INT64_MAX else result
+        
+        result = check()
+        if result is None:
+            # Cached bounds only grow: get the exact ones before giving up
+            self._bound = None
+            if isinstance(other, ArrayRef):
+                other._bound = None
+            result = check()
+        return result
+    
+    def _apply(self, op, other: Union['ArrayRef', int, float], bound):
+        values = self._operand(other)
+        new_bound = None
+        if self._values.dtype.kind == 'i' and not self._fixed:
+            new_bound = self._result_bound(other, bound)
+            if new_bound is None:
+                self._values = self._values.astype(object)
+                if isinstance(values, np.ndarray):
+                    values = values.astype(object)
+        self._values = op(self._values, values)
+        self._bound = new_bound
+        
+    def fill(self, value: Union[int, float]):
+        if self._fixed:
+            value = wrap_int64(value)
+        self._values = np.full(self._length, value, dtype=_dtype_for(value))
+        self._bound = abs(value)
+        
+    def fill_range(self, start: Union[int, float], step: Union[int, float]):
+        last = abs(start) + abs(step) * max(self._length - 1, 0)
+        if type(start) is int and type(step) is int and last > INT64_MAX and not self._fixed:
+            self._values = np.array([start + step * k for k in range(self._length)], dtype=object)
+            self._bound = last
+            return
+        dtype = np.int64 if type(start) is int and type(step) is int else np.float64
+        self._values = start + step * np.arange(self._length, dtype=dtype)
+        self._bound = None if self._fixed else last
+        
+    def add(self, other: Union['ArrayRef', int, float]):
+        self._apply(np.add, other, lambda a, b: a + b)
+        
+    def mul(self, other: Union['ArrayRef', int, float]):
+        self._apply(np.multiply, other, lambda a, b: a * b)
+        
+    def sum(self) -> Union[int, float]:
+        kind = self._values.dtype.kind
+        if kind == 'O' or (kind == 'i' and not self._fixed and self._sum_may_overflow()):
+            return sum(self._values.tolist())
+        return self._values.sum().item()
+    
+    def _sum_may_overflow(self) -> bool:
+        if self._magnitude() * self._length <= INT64_MAX:
+            return False
+        self._bound = None
+        return self._magnitude() * self._length > INT64_MAX
+    
+    def min(self) -> Union[int, float]:
+        return _scalar(self._values.min())
+    
+    def max(self) -> Union[int, float]:
+        return _scalar(self._values.max())
+    
+    def copy_from(self, other: 'ArrayRef'):
+        size = min(self._length, other._length)
+        if other._values.dtype != self._values.dtype:
+            self._values = self._values.astype(np.result_type(self._values, other._values))
+        self._values[:size] = other._values[:size]
+        if self._bound is not None and other._bound is not None:
+            self._bound = max(self._bound, other._bound)
+        else:
+            self._bound = None
+        
+        
+def _scalar(val):
+    return val.item() if isinstance(val, np.generic) else val
+
+
+def _dtype_for(value):
+    if type(value) is int and INT64_MIN <= value <= INT64_MAX:
+        return np.int64
+    if type(value) is float:
+        return np.float64
+    return object
 
 
 class Memory:
-    def __init__(self, size: int = 10):
+    """
+    Ячейки памяти хранятся в плоском списке и адресуются целым числом,
+    имена переменных и массивов отображаются на номера ячеек
+    """
+    
+    def __init__(self, size: int = 10, fixed_width: bool = False):
         assert size % 2 == 0
         self.__size = size
-        self.__buffer: Dict[str, Union[int, float, AssocRef]] = {}
-        self.__assoc_buffer: Dict[str, int] = {}
+        self.__fixed_width = fixed_width  # arrays stay int64/float64
+        self.__cells: List[Union[int, float, None]] = []
+        self.__refs: Dict[int, AssocRef] = {}  # owners of cells
+        self.__symbols: Dict[str, int] = {}  # name -> cell
+        self.__arrays: Dict[str, ArrayRef] = {}  # name -> array
+        self.__epoch = 0  # changes whenever a name or an owner of a cell changes
 
         self.fill_memory()
 
     def fill_memory(self):
-        self.__buffer = {hex(k): None for k in range(int(self.__size / 2))}
-        # self.__assoc_buffer = {None: hex(k) for k in range(int(self.__size / 2))}
-        logger.debug(self.__buffer)
-        logger.debug(self.__assoc_buffer)
+        self.__cells = [None] * int(self.__size / 2)
         
     def check_ref(self, ref: str):
         pass
+    
+    def get_cell(self, ref: int):
+        owner = self.__refs.get(ref)
+        if owner is not None:
+            return owner
+        return self.__cells[ref]
+    
+    def set_cell(self, ref: int, val: Union[int, float]):
+        if ref in self.__refs:
+            raise errors.AssociatedAddressError()
+        self.__cells[ref] = val
+    
+    def get_var(self, name: str):
+        cell = self.__symbols.get(name)
+        if cell is None:
+            return self.__arrays[name]
+        return self.__cells[cell]
+    
+    def set_var(self, name: str, val: Union[int, float]):
+        self.__cells[self.__symbols[name]] = val
         
-    def set_value(self, ref: str, val: Union[int, float]):
-        assoc_ref = self.__assoc_buffer.get(ref)
+    def set_value(self, ref: Ref, val: Union[int, float]):
+        if isinstance(ref, int):
+            return self.set_cell(ref, val)
+        self.set_var(ref, val)
         
-        # TODO: refact
-        if assoc_ref is not None:
-            assoc = self.__buffer[assoc_ref]
-            assoc.set_value(val)
-            logger.success(f'MEMORY::SET_VAL | assoc_ref={assoc_ref} | val={val}')
-        else:
-            if isinstance(self.__buffer[ref], AssocRef):
-                raise errors.AssociatedAddressError()
-            self.__buffer[ref] = val
-            logger.success(f'MEMORY::SET_VAL | ref={ref} | val={val}')
-        
-    def get_value(self, ref: str) -> Union[int, float]:
-        assoc_ref = self.__assoc_buffer.get(ref)
-        if assoc_ref is not None:
-            array_ref = self.__buffer.get(assoc_ref)
-            if isinstance(array_ref, ArrayRef):
-                logger.success(f'MEMORY::GET_VAL | array_ref={ref} | val={assoc_ref}')
-                return array_ref
-            val = self.__buffer[assoc_ref].get_value()
-            logger.success(f'MEMORY::GET_VAL | assoc_ref={ref} | val={val}')
-        else:
-            val = self.__buffer[ref]
-            logger.success(f'MEMORY::GET_VAL | ref={ref} | val={val}')
-        return val
+    def get_value(self, ref: Ref) -> Union[int, float]:
+        if isinstance(ref, int):
+            return self.get_cell(ref)
+        return self.get_var(ref)
     
-    def create_assoc(self, ref: str, name: str):
-        assoc = AssocRef(ref, name)
+    def create_assoc(self, ref: int, name: str):
+        assoc = AssocRef(ref, name, self.__cells)
         
-        self.__assoc_buffer[name] = ref
-        self.__buffer[ref] = assoc
+        name = sys.intern(name)
+        self.__arrays.pop(name, None)
+        self.__symbols[name] = ref
+        self.__refs[ref] = assoc
+        self.__cells[ref] = None
+        self.__epoch += 1
+
+    def get_epoch(self) -> int:
+        return self.__epoch
+    
+    def get_cells(self) -> List[Union[int, float, None]]:
+        return self.__cells
+    
+    def get_size(self) -> int:
+        # Number of cells: half of the requested memory size
+        return len(self.__cells)
+    
+    def resolve_cell(self, ref: Ref) -> Optional[int]:
+        """
+        Номер ячейки, если чтение и запись `ref` - это просто обращение
+        к этой ячейке. Верно, пока не изменился `get_epoch()`
+        """
+        if isinstance(ref, int):
+            return None if ref in self.__refs else ref
+        return self.__symbols.get(ref)
+
+    def get_state(self):
+        """
+        Ячейки, имена и владельцы ячеек - для снимков состояния (snapshot)
+        """
+        return self.__cells, self.__symbols, self.__refs, self.__arrays
+    
+    def set_state(self,
+                  cells: List[Union[int, float, None]],
+                  symbols: Dict[str, int],
+                  refs: Dict[int, AssocRef],
+                  arrays: Dict[str, ArrayRef]):
+        # AssocRef objects passed in must already point at `cells`
+        self.__size = len(cells) * 2
+        self.__cells = cells
+        self.__symbols = symbols
+        self.__refs = refs
+        self.__arrays = arrays
+        self.__epoch += 1
+
+    def close(self):
+        pass
 
     def get_buf_copy(self) -> Dict:
-        return self.__buffer.copy()
+        buf = {hex(k): v for k, v in enumerate(self.__cells)}
+        for k, owner in self.__refs.items():
+            buf[hex(k)] = owner
+        return buf
+    
+    def footprint(self) -> Dict[str, int]:
+        return {
+            'cells': len(self.__cells),
+            'cells_bytes': sys.getsizeof(self.__cells),
+            'arrays_bytes': sum(k._values.nbytes for k in self.__arrays.values()),
+            'refs': len(self.__refs),
+        }
     
     def get_assoc_buf_copy(self) -> Dict:
-        return self.__assoc_buffer.copy()
+        assoc_buf = {k: hex(v) for k, v in self.__symbols.items()}
+        for k, array_ref in self.__arrays.items():
+            assoc_buf[k] = hex(array_ref._ref)
+        return assoc_buf
+
+    def is_fixed_width(self) -> bool:
+        return self.__fixed_width
+    
+    def _make_array(self, ref: int, name: str, length: int) -> ArrayRef:
+        return ArrayRef(ref, name, length, self.__fixed_width)
+    
+    def create_array(self, ref: int, name: str, length: int):
+        array = self._make_array(ref, name, length)
+
+        self.__symbols.pop(name, None)
+        self.__arrays[name] = array
+        self.__refs[ref] = array
+        self.__epoch += 1
 
-    def create_array(self, ref: str, name: str, length: int):
-        array = ArrayRef(ref, name, length)
-        
-        for item in array.get_item_generator():
-            item_ref = item.get_ref()
-            # TODO: check buffer
-            self.__buffer[item_ref] = item
-            item.reg_me()
 
-        self.__assoc_buffer[name] = ref
-        self.__buffer[ref] = array
-            
-            
\ No newline at end of file
+class TracedMemory(Memory):
+    """
+    Memory, которая пишет каждое обращение к ячейкам в лог
+    """
+    
+    def fill_memory(self):
+        super().fill_memory()
+        logger.debug(f'MEMORY::FILL | size={self._Memory__size}')
+    
+    def get_cell(self, ref: int):
+        val = super().get_cell(ref)
+        logger.success(f'MEMORY::GET_VAL | ref={hex(ref)} | val={val}')
+        return val
+    
+    def set_cell(self, ref: int, val: Union[int, float]):
+        super().set_cell(ref, val)
+        logger.success(f'MEMORY::SET_VAL | ref={hex(ref)} | val={val}')
+    
+    def get_var(self, name: str):
+        val = super().get_var(name)
+        if isinstance(val, ArrayRef):
+            logger.success(f'MEMORY::GET_VAL | array_ref={name} | val={hex(val._ref)}')
+        else:
+            logger.success(f'MEMORY::GET_VAL | assoc_ref={name} | val={val}')
+        return val
+    
+    def set_var(self, name: str, val: Union[int, float]):
+        super().set_var(name, val)
+        logger.success(f'MEMORY::SET_VAL | assoc_ref={name} | val={val}')
@@ -1,65 +1,118 @@
-from pprint import pformat, pprint
-from token import DEDENT, INDENT, NL
-from typing import Dict, List, Union
-import numpy as np
-from queue import LifoQueue
-import tokenize
-from tokenize import NEWLINE, ENDMARKER, TokenInfo
-
-from abc import ABC, abstractmethod 
-  
-from loguru import logger
+from functools import partial
+import time
+import sys
+from typing import IO, Callable, Dict, List, Optional, Sequence, Tuple, Union
 
+import bytecode
+import cfg
 import commands as cmd
 import mem
 import errors
+import output
+import hotloop
+import peephole
+import profiler
+import pycode
+import stream
+import utils
+import vm
+from lexer import Token
+import lexer
+
+
+# Imported on first use: the plain run path needs none of these
+logger = utils.LazyImport('loguru', 'logger')  # traced classes
+pprint = utils.LazyImport('pprint')  # DEV_out_buf dumps
+mapped = utils.LazyImport('mapped')  # --memory-file, needs NumPy
+snapshot = utils.LazyImport('snapshot')  # --checkpoint/--resume, needs NumPy
+
+
+REGISTERS = ('_ax', '_bx', '_rx', '_arxn', '_arxi', '_arxv')
 
 
 class OperationMixin:
     def sum_registers(self):
         self._rx = self._ax + self._bx
-        logger.warning(f'MIA::_RX={self._rx}')
         
     def sub_registers(self):
         self._rx = self._ax - self._bx
-        logger.warning(f'MIA::_RX={self._rx}')
         
-    def dev_registers(self):
+    def div_registers(self):
         self._rx = self._ax / self._bx
-        logger.warning(f'MIA::_RX={self._rx}')
         
     def mul_registers(self):
         self._rx = self._ax * self._bx
-        logger.warning(f'MIA::_RX={self._rx}')
         
 
+class FixedWidthMixin(OperationMixin):
+    """
+    Арифметика фиксированной ширины: целые результаты заворачиваются
+    в int64, деление и так даёт float64
+    """
+    
+    def sum_registers(self):
+        self._rx = mem.wrap_int64(self._ax + self._bx)
+        
+    def sub_registers(self):
+        self._rx = mem.wrap_int64(self._ax - self._bx)
+        
+    def mul_registers(self):
+        self._rx = mem.wrap_int64(self._ax * self._bx)
+
+
 class ErrorsMixin:
     ARGS_ERROR = '================= ARGS_ERROR ================='
     KEYWORD_ERROR = '================= KEYWORD_ERROR ================='
     ASSOC_ADDRESS_ERROR = '================= ASSOC_ADDRESS_ERROR ================='
+    ARRAY_ERROR = '================= ARRAY_ERROR ================='
+    INDEX_ERROR = '================= INDEX_ERROR ================='
+    ADDRESS_ERROR = '================= ADDRESS_ERROR ================='
+    SNAPSHOT_ERROR = '================= SNAPSHOT_ERROR ================='
+    
+    ERROR_CONTEXT = 3  # source lines shown before and after the failing one
+    
+    _keyword_docs: Optional[str] = None
+    
+    def _print_report(self, *args):
+        print(*args, file=self._report or sys.stdout)
+        
+    def _abort(self):
+        quit()
+    
+    def set_source_map(self, source_map: lexer.SourceMap):
+        self._source_map = source_map
+        
+    def _get_source_map(self) -> lexer.SourceMap:
+        # A program loaded from the bytecode cache was never lexed
+        if self._source_map is None and self._source is not None:
+            self._source_map = lexer.SourceMap.from_source(self._filename, self._source, keep=True)
+        elif self._source_map is None:
+            self._source_map = lexer.SourceMap.from_file(self._filename)
+        return self._source_map
+    
+    def _get_context_range(self, index_line_with_error: int):
+        if self._error_context is None or self._error_context < 0:
+            return 1, sys.maxsize
+        return (index_line_with_error - self._error_context,
+                index_line_with_error + self._error_context)
     
     def print_code_before_error(self, index_line_with_error: int):
-        cur_line = 0
-        for tok in self._tokens:
-            if tok.start[0] < index_line_with_error:
-                if cur_line != tok.start[0]:
-                    print(f'{tok.start[0]}: {tok.line}', end='')
-                    cur_line = tok.start[0]
-        print()
+        first, _ = self._get_context_range(index_line_with_error)
+        for i_line, line in self._get_source_map().lines(first, index_line_with_error - 1):
+            self._print_report(f'{i_line}: {line}')
+        self._print_report()
             
     def print_code_after_error(self, index_line_with_error: int):
-        cur_line = 0
-        for tok in self._tokens:
-            if tok.start[0] >= index_line_with_error + 1:
-                if tok.type == ENDMARKER:
-                    break
-                if cur_line != tok.start[0]:
-                    print(f'{tok.start[0]}: {tok.line}', end='')
-                    cur_line = tok.start[0]
+        _, last = self._get_context_range(index_line_with_error)
+        for i_line, line in self._get_source_map().lines(index_line_with_error + 1, last):
+            self._print_report(f'{i_line}: {line}')
+            
+    def _get_line_text(self, t: Token) -> str:
+        return self._get_source_map().line(t.line)
             
-    def print_body_error(self, err_const: str, t: TokenInfo, docs: str):
-        line = t.line.replace("\n", '')
-        i_line = t.start[0]
+    def print_body_error(self, err_const: str, t: Token, docs: str):
+        line = self._get_line_text(t)
+        i_line = t.line
         a = len(line)
         
         
@@ -67,54 +120,101 @@ class ErrorsMixin:
         border = "    |"
         docs = f'{border} {docs}'
         
-        print(f'{err_const} on Line {i_line}\n')
-        print(line)
-        print('^' * a)
-        print(docs)
-        print()
-        print(f'{err_const} on Line {i_line}\n')
-        
-    def _print_error(self, err_const: str, t: TokenInfo, docs: str):
-        index_line_with_error = t.start[0]
-        print()
+        self._print_report(f'{err_const} on Line {i_line}\n')
+        self._print_report(line)
+        self._print_report('^' * a)
+        self._print_report(docs)
+        self._print_report()
+        self._print_report(f'{err_const} on Line {i_line}\n')
+        
+    def _print_error(self, err_const: str, t: Token, docs: str):
+        self.flush_output()
+        index_line_with_error = t.line
+        self._print_report()
         self.print_code_before_error(index_line_with_error)
         self.print_body_error(err_const, t, docs)
         self.print_code_after_error(index_line_with_error)
-        print('')
+        self._print_report('')
     
-    def print_args_error(self, t: TokenInfo, docs: str):
+    def print_args_error(self, t: Token, docs: str):
         self._print_error(self.ARGS_ERROR, t, docs)
-        quit()
-        
-    def print_keyword_error(self, t: TokenInfo):
-        def gen_doc(x):
-            return x + ('_' * 50)
-        
-        docs = '\n'.join(
-            [
-                gen_doc(k.repr_doc())
-                for k in cmd.CMD_MAPPING.values()
-            ]
-        )
-        docs = ('_' * 50) + '\n' + docs
-        self._print_error(self.KEYWORD_ERROR, t, docs)
-        quit()
+        self._abort()
+        
+    @classmethod
+    def _get_keyword_docs(cls) -> str:
+        # The command list is static: build the docs once per process
+        if cls._keyword_docs is None:
+            def gen_doc(x):
+                return x + ('_' * 50)
+            
+            docs = '\n'.join(
+                [
+                    gen_doc(k.repr_doc())
+                    for k in cmd.CMD_MAPPING.values()
+                ]
+            )
+            cls._keyword_docs = ('_' * 50) + '\n' + docs
+        return cls._keyword_docs
+        
+    def print_keyword_error(self, t: Token):
+        self._print_error(self.KEYWORD_ERROR, t, self._get_keyword_docs())
+        self._abort()
 
-    def print_assoc_address_error(self, t: TokenInfo, ref: str):
+    def print_assoc_address_error(self, t: Token, ref: mem.Ref):
         docs = '\nВы не можете напрямую записывать в эту область памяти,\n' \
             'т.к. она ассоциирована с переменной.\n\n'
         docs += repr(self._memory.get_value(ref))
         docs += '\n'
         self._print_error(self.ASSOC_ADDRESS_ERROR, t, docs)
-        quit()
+        self._abort()
+        
+    def print_array_error(self, t: Token, val, reason: str = 'Ожидался массив, а по этому адресу лежит:'):
+        docs = f'\n{reason}\n\n'
+        docs += repr(val)
+        docs += '\n'
+        self._print_error(self.ARRAY_ERROR, t, docs)
+        self._abort()
+        
+    def print_index_error(self, t: Token, array_ref: mem.ArrayRef, index: int):
+        docs = f'\nИндекс {index} за пределами массива {array_ref._name} ' \
+            f'из {array_ref._length} элементов.\n'
+        self._print_error(self.INDEX_ERROR, t, docs)
+        self._abort()
+        
+    def print_address_error(self, t: Token, ref: int):
+        docs = f'\nАдрес {hex(ref)} за пределами памяти: ' \
+            f'доступны ячейки 0x0 ... {hex(self._memory.get_size() - 1)}.\n' \
+            'Ячеек вдвое меньше, чем --memory-size.\n'
+        self._print_error(self.ADDRESS_ERROR, t, docs)
+        self._abort()
+        
+    def print_snapshot_error(self, path: str, reason: str):
+        self.flush_output()
+        self._print_report()
+        self._print_report(self.SNAPSHOT_ERROR)
+        self._print_report(f'{path}: {reason}')
+        self._print_report(self.SNAPSHOT_ERROR)
+        self._print_report('')
+        self._abort()
 
 
 class IOMixin:
     def print_val(self, val):
-        print(f'>>> {val}')
+        if isinstance(val, mem.ArrayRef):
+            val = val.get_value()
+        self._out.write(f'>>> {val}\n')
         
     def print_ref_val(self, ref, val):
-        print(f'>>> [{ref}] = {val}')
+        if isinstance(val, mem.ArrayRef):
+            val = val.get_value()
+        self._out.write(f'>>> [{ref}] = {val}\n')
+        
+    def flush_output(self):
+        # Anything printed directly must come after the buffered `out` lines
+        self._out.flush()
+        
+    def close_output(self):
+        self._out.close()
         
     def print_welcome(self):
         print('==================|MiaLang|==================')
@@ -124,10 +224,17 @@ class IOMixin:
         print(':OUT:\n')
         
     def print_buf(self):
-        pprint(self._memory.get_buf_copy(), width=40)
+        self._out.write(pprint.pformat(self._memory.get_buf_copy(), width=40) + '\n')
         
     def print_assoc_buf(self):
-        pprint(self._memory.get_assoc_buf_copy(), width=40)
+        self._out.write(pprint.pformat(self._memory.get_assoc_buf_copy(), width=40) + '\n')
+        
+    def print_memory_report(self):
+        self.flush_output()
+        print('==================|MEMORY|==================')
+        for k, v in self.memory_report().items():
+            print(f'= {k}: {v}')
+        print('=============================================')
         
         
 class FlowMixin:
@@ -136,63 +243,209 @@ class FlowMixin:
         
     def set_cmd_index_from_def_name(self, def_name: str):
         self._cmd_index = self._def_names[def_name]
-        logger.warning(f'MIA::SET_CMD_INDEX | index={self._cmd_index}')
+        
+    def set_cmd_index(self, cmd_index: int):
+        self._cmd_index = cmd_index
+        
+    def _jump(self, def_name: str, target: Optional[int]):
+        call_index = self._cmd_index
+        if target is None:
+            self.set_cmd_index_from_def_name(def_name)
+        else:
+            self.set_cmd_index(target)
+        if self._loops is not None and self._cmd_index < call_index:
+            self._loops.on_back_edge(call_index)
     
-    def call_if_val(self, def_name, val):
+    def call_if_val(self, def_name, val, target: Optional[int] = None):
         if val > 0:
-            logger.warning('MIA::CALL_IF_VAL | TRUE')
-            return self.set_cmd_index_from_def_name(def_name)
-        logger.warning('MIA::CALL_IF_VAL | FALSE')
+            return self._jump(def_name, target)
     
-    def call_if_rx(self, def_name):
+    def call_if_rx(self, def_name, target: Optional[int] = None):
         if self._rx > 0:
-            logger.warning('MIA::CALL_IF_RX | TRUE')
-            return self.set_cmd_index_from_def_name(def_name)
-        logger.warning('MIA::CALL_IF_RX | FALSE')
+            return self._jump(def_name, target)
 
     
 class RegistersMixin:
     def reg_ax(self, val):
         self._ax = val
-        logger.warning(f'MIA_CORE::REG_AX | ax={self._ax}')
         
     def reg_bx(self, val):
         self._bx = val
-        logger.warning(f'MIA_CORE::REG_BX | bx={self._bx}')
         
     def reg_arxn(self, val):
-        assert isinstance(val, str)
+        assert isinstance(val, (str, int))
         self._arxn = val
-        logger.warning(f'MIA_CORE::REG_ARXN | arxn={self._arxn}')
         
-    def reg_arxi(self, val):
+    def reg_arxi(self, val, t: Token):
         assert isinstance(val, int)
         self._arxi = val
-        logger.warning(f'MIA_CORE::REG_ARXI | arxi={self._arxi}')
+        if self._arxn != '':
+            array_ref = self.as_array(self._memory.get_value(self._arxn), t)
+            try:
+                self._arxv = array_ref.get_value(val)
+            except IndexError:
+                self.print_index_error(t, array_ref, val)
         
-    def push_value_to_array_item(self, val):
-        ref = self._arxn
-        array_ref = self._memory.get_value(ref)
-        array_ref.set_value(val, self._arxi)
+    def push_value_to_array_item(self, val, t: Token):
+        array_ref = self.as_array(self._memory.get_value(self._arxn), t)
+        try:
+            array_ref.set_value(self._arxi, val)
+        except IndexError:
+            self.print_index_error(t, array_ref, self._arxi)
         self._arxv = val
-        logger.warning(f'MIA_CORE::PUSH | arr={ref} index={self._arxi} val={val}')
         
     def get_rx(self) -> Union[int, float]:
         return self._rx
     
 
+class TraceMixin:
+    """
+    Логирующие версии горячих методов. Подмешивается только
+    при `trace=True`, без трассировки эти вызовы не выполняются вовсе
+    """
+    
+    def sum_registers(self):
+        super().sum_registers()
+        logger.warning(f'MIA::_RX={self._rx}')
+        
+    def sub_registers(self):
+        super().sub_registers()
+        logger.warning(f'MIA::_RX={self._rx}')
+        
+    def div_registers(self):
+        super().div_registers()
+        logger.warning(f'MIA::_RX={self._rx}')
+        
+    def mul_registers(self):
+        super().mul_registers()
+        logger.warning(f'MIA::_RX={self._rx}')
+        
+    def set_cmd_index_from_def_name(self, def_name: str):
+        super().set_cmd_index_from_def_name(def_name)
+        logger.warning(f'MIA::SET_CMD_INDEX | index={self._cmd_index}')
+        
+    def set_cmd_index(self, cmd_index: int):
+        super().set_cmd_index(cmd_index)
+        logger.warning(f'MIA::SET_CMD_INDEX | index={self._cmd_index}')
+        
+    def call_if_val(self, def_name, val, target: Optional[int] = None):
+        logger.warning(f'MIA::CALL_IF_VAL | {"TRUE" if val > 0 else "FALSE"}')
+        super().call_if_val(def_name, val, target)
+    
+    def call_if_rx(self, def_name, target: Optional[int] = None):
+        logger.warning(f'MIA::CALL_IF_RX | {"TRUE" if self._rx > 0 else "FALSE"}')
+        super().call_if_rx(def_name, target)
+        
+    def reg_ax(self, val):
+        super().reg_ax(val)
+        logger.warning(f'MIA_CORE::REG_AX | ax={self._ax}')
+        
+    def reg_bx(self, val):
+        super().reg_bx(val)
+        logger.warning(f'MIA_CORE::REG_BX | bx={self._bx}')
+        
+    def reg_arxn(self, val):
+        super().reg_arxn(val)
+        logger.warning(f'MIA_CORE::REG_ARXN | arxn={self._arxn}')
+        
+    def reg_arxi(self, val, t: Token):
+        super().reg_arxi(val, t)
+        logger.warning(f'MIA_CORE::REG_ARXI | arxi={self._arxi}')
+        
+    def push_value_to_array_item(self, val, t: Token):
+        super().push_value_to_array_item(val, t)
+        logger.warning(f'MIA_CORE::PUSH | arr={self._arxn} index={self._arxi} val={val}')
+    
+    def _run(self, commands: List[cmd.MiaCommand]):
+        while self._cmd_index < len(commands):
+            logger.debug(commands[self._cmd_index].__class__)
+            commands[self._cmd_index].do()
+            self._cmd_index += 1
+    
+
 class Mia(OperationMixin, IOMixin, RegistersMixin, FlowMixin, ErrorsMixin):
     V = '0.0.15'
+    
+    ENGINES = ('classic', 'vm', 'py')
+    CHECKPOINT_EVERY = 100000  # commands between snapshots
+    
+    def __new__(cls, *args, trace: bool = False, fixed_width: bool = False, **kwargs):
+        # The trace level and the number width are fixed here: each variant
+        # is a separate class, so the default one keeps its plain hot paths.
+        # Variants derive from the requested class, subclasses keep their methods
+        mixins = []
+        if trace and not issubclass(cls, TraceMixin):
+            mixins.append(TraceMixin)
+        if fixed_width and not issubclass(cls, FixedWidthMixin):
+            mixins.append(FixedWidthMixin)
+        if mixins:
+            cls = _variant(cls, tuple(mixins))
+        return super().__new__(cls)
 
-    def __init__(self, filename: str, memory_size: int):
-        self._filename = filename
-        self._reader = open(filename, 'rb')
-        self._memory = mem.Memory(memory_size)
+    def __init__(self, 
+                 filename: str, 
+                 memory_size: int, 
+                 use_cache: bool = True, 
+                 engine: str = 'classic',
+                 trace: bool = False,
+                 profile: bool = False,
+                 stream: bool = False,
+                 error_context: Optional[int] = ErrorsMixin.ERROR_CONTEXT,
+                 optimize: bool = True,
+                 hot_loops: bool = True,
+                 output_path: Optional[str] = None,
+                 line_buffered: Optional[bool] = None,
+                 source: Optional[bytes] = None,
+                 writer: Optional[output.OutputWriter] = None,
+                 checkpoint: Optional[str] = None,
+                 checkpoint_every: int = CHECKPOINT_EVERY,
+                 resume: Optional[str] = None,
+                 memory_path: Optional[str] = None,
+                 fixed_width: bool = False):
+        assert engine in self.ENGINES
+        # The profiler times command objects one by one
+        assert not profile or engine == 'classic'
+        # The streaming mode has no command list for the VM or the profiler
+        assert not stream or (engine == 'classic' and not profile)
+        # Checkpoints are taken between slices of the classic engine
+        assert not checkpoint or (engine == 'classic' and not profile and not stream)
+        assert checkpoint_every > 0
+        # The memory file is the persistent state there, snapshots hold lists of cells
+        assert memory_path is None or not (checkpoint or resume)
+        self._filename = filename  # with `source` given, only a name for messages
+        self._source = source
+        if memory_path is not None:
+            self._memory = (mapped.TracedMappedMemory if trace else mapped.MappedMemory)(
+                memory_size, memory_path, fixed_width
+            )
+        else:
+            self._memory = (mem.TracedMemory if trace else mem.Memory)(memory_size, fixed_width)
+        self._fixed_width = fixed_width  # int64 arithmetic, see FixedWidthMixin
+        # The caches live next to the source file
+        self._use_cache = use_cache and source is None
+        self._engine = engine
+        self._profile = profile
+        self._optimize = optimize
+        # Specialized loops bypass the traced memory, so not with tracing
+        self._hot_loops = hot_loops and not trace
+        self._loops: Optional[hotloop.LoopSpecializer] = None
+        self._profiler: Optional[profiler.Profiler] = None
+        self._out = writer if writer is not None else output.OutputWriter(output_path, line_buffered)
+        self._report: Optional[IO[str]] = None  # error reports, stdout by default
+        self._stream = stream
+        self._program = None  # stream.StreamProgram in the streaming mode
+        self._source_map: Optional[lexer.SourceMap] = None
+        self._digest = b''
+        self._error_context = error_context  # None: the whole file
+        self._checkpoint = checkpoint  # snapshot path
+        self._checkpoint_every = checkpoint_every  # commands between snapshots
+        self._resume = resume  # snapshot to continue from
         
         self._cmd_index = 0
         self._def_names: Dict[str, int] = {}
         self._cmd_list: List[cmd.MiaCommand] = []
-        self._tokens: List[TokenInfo] = []
+        self._def_indexes: Dict[str, List[int]] = {}
+        self._cfg: Optional[cfg.ControlFlowGraph] = None
         
         self._ax = 0  # var A register
         self._bx = 0  # var B register
@@ -201,16 +454,35 @@ class Mia(OperationMixin, IOMixin, RegistersMixin, FlowMixin, ErrorsMixin):
         self._arxi = 0  # array_item[_arxi] register
         self._arxv = 0  # RES: array_item_val[_arxi]
         
-    def _is_register_name(self, name: str):
-        mapping = {
-            '_ax': 1,
-            '_bx': 2,
-            '_rx': 3,
-            '_arxn': 4,
-            '_arxi': 5,
-            '_arxv': 6
+    def get_registers(self) -> Dict[str, Union[int, float, str]]:
+        return {k: getattr(self, k) for k in REGISTERS}
+        
+    def set_register(self, name: str, val: Union[int, float, str]):
+        if not self._is_register_name(name):
+            raise ValueError(f'unknown register {name!r}')
+        setattr(self, name, val)
+        
+    def close_memory(self):
+        self._memory.close()
+        
+    def memory_report(self) -> Dict[str, int]:
+        report = {
+            'commands': len(self._cmd_list),
+            'commands_bytes': sum(
+                sys.getsizeof(k) + sys.getsizeof(k._t_cmd) for k in self._cmd_list
+            ),
         }
-        return bool(mapping.get(name))
+        report.update(self._memory.footprint())
+        try:
+            import resource
+        except ImportError:  # not available on Windows
+            return report
+        # ru_maxrss is in kilobytes on Linux
+        report['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return report
+        
+    def _is_register_name(self, name: str):
+        return name in REGISTERS
         
     def try_get_register_value(self, reg_name: str):
         if not self._is_register_name(reg_name):
@@ -223,42 +495,63 @@ class Mia(OperationMixin, IOMixin, RegistersMixin, FlowMixin, ErrorsMixin):
     def define_name(self, def_name: str, cmd_index: int):
         self._def_names[def_name] = cmd_index
         
-    def set_to_buffer(self, ref: str, val: Union[int, float]):
+    def resolve_def_name(self, def_name: str) -> Optional[int]:
+        # A label defined once is static, wherever the `defn` stands: forward
+        # calls included. Several `defn` keep the runtime lookup in `_def_names`.
+        return cfg.resolve_label(self._def_indexes, def_name)
+    
+    def bind_source(self, ref: mem.Ref) -> Callable[[], Union[int, float]]:
+        if isinstance(ref, int):
+            return partial(self._memory.get_cell, ref)
+        if self._is_register_name(ref):
+            return partial(getattr, self, ref)
+        return partial(self._memory.get_var, ref)
+    
+    def bind_target(self, ref: mem.Ref) -> Callable[[Union[int, float]], None]:
+        if isinstance(ref, int):
+            return partial(self._memory.set_cell, ref)
+        return partial(self._memory.set_var, ref)
+        
+    def set_to_buffer(self, ref: mem.Ref, val: Union[int, float]):
         self._memory.set_value(ref, val)
         
-    def create_assoc(self, ref: str, name: str):
+    def create_assoc(self, ref: int, name: str):
         self._memory.create_assoc(ref, name)
         
-    def create_array(self, ref: str, name: str, length: int):
+    def create_array(self, ref: int, name: str, length: int):
         self._memory.create_array(ref, name, length)
         
-    def get_from_buffer(self, ref: str) -> Union[int, float]:
+    def check_address(self, ref: int, t: Token) -> int:
+        if not 0 <= ref < self._memory.get_size():
+            self.print_address_error(t, ref)
+        return ref
+        
+    def as_array(self, val, t: Token) -> mem.ArrayRef:
+        if not isinstance(val, mem.ArrayRef):
+            self.print_array_error(t, val)
+        return val
+        
+    def as_nonempty_array(self, val, t: Token) -> mem.ArrayRef:
+        array_ref = self.as_array(val, t)
+        if array_ref._length == 0:
+            self.print_array_error(t, array_ref, 'У пустого массива нет ни минимума, ни максимума:')
+        return array_ref
+        
+    def as_array_operand(self, array_ref: mem.ArrayRef, val, t: Token):
+        # Element-wise operations need arrays of the same length, numbers go as is
+        if isinstance(val, mem.ArrayRef) and val._length != array_ref._length:
+            self.print_array_error(
+                t, val, f'Ожидался массив той же длины, что {array_ref._name} ({array_ref._length}), а лежит:'
+            )
+        return val
+        
+    def get_from_buffer(self, ref: mem.Ref) -> Union[int, float]:
         val = self.try_get_register_value(ref)
         if val is not None:
             return val
         return self._memory.get_value(ref)
         
-    def _get_clear_lines(self, tokens: List[TokenInfo]):
-        # TODO: refact
-        nl_indexes = []
-        i = 0
-        for t in tokens:
-            if t.type in (NEWLINE, NL, INDENT, DEDENT):
-                nl_indexes.append(i)
-            i += 1
-            
-        lines: List[List[tokenize.TokenInfo]] = []
-
-        start = 0
-        for i in nl_indexes:
-            lines.append(tokens[start:i])
-            start = i + 1
-        
-        lines = [k for k in lines if k and k[0].string != '//']
-            
-        return lines
-    
-    def _parse_line_args(self, line: List[TokenInfo]):
+    def _parse_line_args(self, line: List[Token]):
         arg1 = None
         arg2 = None
         arg3 = None
@@ -281,34 +574,264 @@ class Mia(OperationMixin, IOMixin, RegistersMixin, FlowMixin, ErrorsMixin):
         
         return arg1, arg2, arg3
         
-    def _create_cmd_list(self, lines: List[List[TokenInfo]]):
+    def _create_cmd(self, line: List[Token], cmd_index: int) -> cmd.MiaCommand:
+        try:
+            arg1, arg2, arg3 = self._parse_line_args(line)
+            return cmd.MiaCommand.factory(self, line[0], arg1, arg2, arg3, cmd_index)
+        except KeyError:
+            self.print_keyword_error(line[0])
+        
+    def _create_cmd_list(self, lines: List[List[Token]]):
         coms: List[cmd.MiaCommand] = []
         
         for line in lines:
-            try:
-                arg1, arg2, arg3 = self._parse_line_args(line)
-                coms.append(cmd.MiaCommand.factory(self, line[0], arg1, arg2, arg3, len(coms)))
-            except KeyError:
-                self.print_keyword_error(line[0])
+            coms.append(self._create_cmd(line, len(coms)))
         return coms
+    
+    def _create_cmd_list_from_bytecode(self, instrs: Sequence[bytecode.Instr]):
+        coms: List[cmd.MiaCommand] = []
+        classes, names = cmd.OPCODE_CLASSES, cmd.OPCODE_NAMES
         
-    def main(self):
-        self.print_welcome()
-        
-        tokens = tokenize.tokenize(self._reader.__next__)
-        tokens = [k for k in tokens][1:]
-        self._tokens = tokens
+        for index, (op, line, col, args) in enumerate(instrs):
+            # Operands come parsed and shared between commands, no tokens per argument
+            arg1, arg2, arg3 = args + (None,) * (3 - len(args))
+            coms.append(classes[op](self, Token(names[op], line, col), arg1, arg2, arg3, index))
+        return coms
+    
+    def _to_bytecode(self, lines: List[List[Token]]) -> List[bytecode.Instr]:
+        operands: Dict[str, lexer.Operand] = {}
+        instrs: List[bytecode.Instr] = []
         
-        lines = self._get_clear_lines(tokens)
-        # pprint(lines, width=40)
+        for line in lines:
+            args = []
+            for t in line[1:4]:
+                arg = operands.get(t.string)
+                if arg is None:
+                    arg = operands[t.string] = utils.to_operand(t.string)
+                args.append(arg)
+            instrs.append(bytecode.Instr(
+                bytecode.opcode(line[0].string), line[0].line, line[0].col, tuple(args)
+            ))
+        return instrs
+    
+    def _read_source(self) -> bytes:
+        if self._source is not None:
+            return self._source
+        with open(self._filename, 'rb') as f:
+            return f.read()
+    
+    def _compile(self) -> List[cmd.MiaCommand]:
+        source = self._read_source()
+        
+        digest = bytecode.source_digest(source)
+        self._digest = digest
+        if self._use_cache:
+            instrs = bytecode.read_cache(self._filename, self.V, digest)
+            if instrs is not None:
+                return self._create_cmd_list_from_bytecode(instrs)
+        
+        self._source_map = lexer.SourceMap.from_source(
+            self._filename, source, keep=self._source is not None
+        )
+        lines = list(lexer.lex(source))
         commands = self._create_cmd_list(lines)
         
+        if self._use_cache:
+            bytecode.write_cache(self._filename, self._to_bytecode(lines), self.V, digest)
+        return commands
+    
+    def _bind_cmd_list(self, commands: List[cmd.MiaCommand]):
+        self._cfg = cfg.build(commands)
+        self._def_indexes = self._cfg.labels
+        
+        for com in commands:
+            com.bind()
+            com.release_tokens()
+        
+    def _load_stream(self):
+        self._program = stream.StreamProgram(self, self._filename)
+        self._def_indexes = self._program.scan()
+        
+    def load(self, instrs: Optional[Sequence[bytecode.Instr]] = None) -> List[cmd.MiaCommand]:
+        """
+        `instrs` - уже скомпилированная программа (см. `program.Program`)
+        """
+        if self._stream:
+            self._load_stream()
+            return []
+        
+        with utils.paused_gc():
+            if instrs is not None:
+                commands = self._create_cmd_list_from_bytecode(instrs)
+            else:
+                commands = self._compile()
+            if self._optimize:
+                commands = peephole.optimize(commands)
+            self._bind_cmd_list(commands)
+        
         self._cmd_list = commands
+        if self._resume:
+            self.restore_snapshot(self._resume)
+        return commands
+    
+    def save_snapshot(self, path: str):
+        snapshot.write_snapshot(self, path)
+    
+    def restore_snapshot(self, path: str):
+        """
+        Продолжить с места снимка: вывод до снимка не повторяется
+        """
+        try:
+            snapshot.read_snapshot(self, path)
+        except (OSError, errors.SnapshotError) as e:
+            self.print_snapshot_error(path, str(e))
         
-        # pprint(commands, width=40)
+    def run(self):
+        commands = self._cmd_list
+        try:
+            if self._stream:
+                self._run_stream(self._program)
+            elif self._profile:
+                self._profiler = profiler.Profiler(commands, self._cfg)
+                self._run_profiled(commands)
+            elif self._engine == 'vm':
+                vm.MiaVM(self, commands).run()
+            elif self._engine == 'py':
+                self._run_py(commands)
+            elif self._checkpoint:
+                self._run_checkpointed()
+            else:
+                if self._hot_loops:
+                    self._loops = hotloop.LoopSpecializer(self, commands)
+                self._run(commands)
+        finally:
+            # Also on errors: `quit()` and exceptions leave through here
+            self.flush_output()
+        
+    def run_slice(self, budget: int) -> int:
+        """
+        Выполняет не больше `budget` команд на движке classic,
+        возвращает, сколько выполнено
+        """
+        commands = self._cmd_list
+        n = len(commands)
+        done = 0
+        try:
+            while done < budget and self._cmd_index < n:
+                commands[self._cmd_index].do()
+                self._cmd_index += 1
+                done += 1
+        except BaseException:
+            self.flush_output()
+            raise
+        if self._cmd_index >= n:
+            self.flush_output()
+        return done
+        
+    def is_finished(self) -> bool:
+        return self._cmd_index >= len(self._cmd_list)
         
-        while self._cmd_index < len(lines):
-            logger.debug(commands[self._cmd_index].__class__)
+    def main(self):
+        self.print_welcome()
+        self.load()
+        self.run()
+            
+    def get_profiler(self) -> Optional[profiler.Profiler]:
+        return self._profiler
+        
+    def get_cfg(self) -> Optional[cfg.ControlFlowGraph]:
+        return self._cfg
+        
+    def _run(self, commands: List[cmd.MiaCommand]):
+        while self._cmd_index < len(commands):
+            commands[self._cmd_index].do()
+            self._cmd_index += 1
+            
+    def _run_checkpointed(self):
+        while True:
+            self.run_slice(self._checkpoint_every)
+            if self.is_finished():
+                break
+            # Whatever was printed before the snapshot is not printed on resume
+            self.flush_output()
+            self.save_snapshot(self._checkpoint)
+            
+    def _run_stream(self, program: stream.StreamProgram):
+        try:
+            while True:
+                com = program.get(self._cmd_index)
+                if com is None:
+                    break
+                com.do()
+                self._cmd_index += 1
+        finally:
+            program.close()
+
+    def _run_py(self, commands: List[cmd.MiaCommand]):
+        program = pycode.PyProgram(self, commands)
+        
+        # A snapshot may stop inside a block: the classic loop runs up to
+        # the next entry point of the compiled code
+        entries = set(self._cfg.entry_points())
+        while self._cmd_index < len(commands) and self._cmd_index not in entries:
             commands[self._cmd_index].do()
             self._cmd_index += 1
-                
\ No newline at end of file
+        if self._cmd_index >= len(commands):
+            return
+        
+        trace = isinstance(self, TraceMixin)
+        code = None
+        if self._use_cache:
+            code = pycode.read_cache(self._filename, self.V, self._digest, self._optimize, self._fixed_width,
+                                     trace)
+        if code is None:
+            code = program.compile()
+            if self._use_cache:
+                pycode.write_cache(self._filename, code, self.V, self._digest, self._optimize,
+                                   self._fixed_width, trace)
+        program.run(code)
+
+    def _run_profiled(self, commands: List[cmd.MiaCommand]):
+        counts = self._profiler.counts
+        times = self._profiler.times
+        clock = time.perf_counter
+        
+        while self._cmd_index < len(commands):
+            i = self._cmd_index
+            start = clock()
+            commands[i].do()
+            times[i] += clock() - start
+            counts[i] += 1
+            self._cmd_index += 1
+
+
+class TracedMia(TraceMixin, Mia):
+    pass
+
+
+class FixedWidthMia(FixedWidthMixin, Mia):
+    pass
+
+
+class TracedFixedWidthMia(TraceMixin, FixedWidthMixin, Mia):
+    pass
+
+
+# (class, mixins) -> variant, the ones for Mia itself are declared above
+_VARIANTS: Dict[Tuple[type, Tuple[type, ...]], type] = {
+    (Mia, (TraceMixin,)): TracedMia,
+    (Mia, (FixedWidthMixin,)): FixedWidthMia,
+    (Mia, (TraceMixin, FixedWidthMixin)): TracedFixedWidthMia,
+}
+
+
+_PREFIXES = {TraceMixin: 'Traced', FixedWidthMixin: 'FixedWidth'}
+
+
+def _variant(cls: type, mixins: Tuple[type, ...]) -> type:
+    variant = _VARIANTS.get((cls, mixins))
+    if variant is None:
+        name = ''.join(_PREFIXES[k] for k in mixins) + cls.__name__
+        variant = type(name, mixins + (cls,), {'__module__': cls.__module__})
+        _VARIANTS[cls, mixins] = variant
+    return variant
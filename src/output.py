@@ -0,0 +1,75 @@
+import sys
+from typing import IO, List, Optional
+
+
+BUFFER_SIZE = 64 * 1024
+
+
+class OutputWriter:
+    """
+    Буфер для вывода `out`/`outf`: строки копятся и пишутся разом,
+    когда буфер заполнен, в конце программы или перед сообщением об ошибке
+    """
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 line_buffered: Optional[bool] = None,
+                 buffer_size: int = BUFFER_SIZE):
+        self._path = path
+        self._file: Optional[IO[str]] = None
+        if line_buffered is None:
+            # Interactive use: show every line as soon as it is printed
+            line_buffered = path is None and sys.stdout.isatty()
+        self._line_buffered = line_buffered
+        self._buffer_size = buffer_size
+        self._buf: List[str] = []
+        self._size = 0
+
+    def _get_stream(self) -> IO[str]:
+        if self._path is None:
+            # Looked up on every flush: callers may redirect sys.stdout
+            return sys.stdout
+        if self._file is None:
+            self._file = open(self._path, 'w', encoding='utf-8')
+        return self._file
+
+    def write(self, text: str):
+        self._buf.append(text)
+        self._size += len(text)
+        if self._line_buffered or self._size >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buf:
+            return
+        stream = self._get_stream()
+        stream.write(''.join(self._buf))
+        self._buf.clear()
+        self._size = 0
+        if self._line_buffered:
+            stream.flush()
+
+    def close(self):
+        self.flush()
+        if self._path is not None:
+            self._get_stream()  # an empty output still leaves a file
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CaptureWriter(OutputWriter):
+    """
+    Собирает вывод в список строк вместо записи в поток
+    """
+
+    def __init__(self):
+        super().__init__(line_buffered=False)
+        self.lines: List[str] = []
+
+    def write(self, text: str):
+        # DEV_out_buf dumps span several lines
+        self.lines.extend(text.rstrip('\n').split('\n'))
+
+    def flush(self):
+        pass
@@ -0,0 +1,49 @@
+import sys
+from typing import List
+
+import commands as cmd
+from lexer import Token
+
+
+def _fused_token(parts: List[cmd.MiaCommand]) -> Token:
+    # The name shows up in profiles, the position is the first part's
+    first = parts[0]._t_cmd
+    name = '+'.join(k._t_cmd.string for k in parts)
+    return Token(sys.intern(name), first.line, first.col)
+
+
+def optimize(commands: List[cmd.MiaCommand]) -> List[cmd.MiaCommand]:
+    """
+    Сливает `ax <a>` `bx <b>` `sum|sub|mul|div <ref>` (и их части
+    `ax`+`op`, `bx`+`op`) в одну команду FusedArithCmd.
+    Работает до bind(): индексы команд пересчитываются заново
+    """
+    out: List[cmd.MiaCommand] = []
+    n = len(commands)
+    i = 0
+    while i < n:
+        ax_cmd = bx_cmd = None
+        j = i
+        if isinstance(commands[j], cmd.RegAxCmd):
+            ax_cmd = commands[j]
+            j += 1
+        if j < n and isinstance(commands[j], cmd.RegBxCmd):
+            bx_cmd = commands[j]
+            j += 1
+        
+        if j < n and j > i and type(commands[j]) in cmd.FusedArithCmd.OPERATIONS:
+            parts = [k for k in (ax_cmd, bx_cmd, commands[j]) if k is not None]
+            out.append(cmd.FusedArithCmd(
+                commands[j]._mia, _fused_token(parts), ax_cmd, bx_cmd, commands[j], len(out)
+            ))
+            i = j + 1
+            continue
+        
+        out.append(commands[i])
+        i += 1
+    
+    # `defn` registers its own index and `call` targets are resolved
+    # from these indexes later, in bind()
+    for index, com in enumerate(out):
+        com._cmd_index = index
+    return out
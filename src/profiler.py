@@ -0,0 +1,89 @@
+from typing import Dict, List
+
+import cfg
+import commands as cmd
+import utils
+
+
+json = utils.LazyImport('json')
+
+
+MAIN_BLOCK = '<main>'
+
+
+class Profiler:
+    """
+    Счётчики выполнений и суммарное время каждой команды.
+    Время команды также относится к блоку `defn`, в котором она стоит:
+    от `defn` до `call` с переходом назад на него или до конца программы
+    """
+
+    def __init__(self, commands: List[cmd.MiaCommand], graph: cfg.ControlFlowGraph):
+        self._commands = commands
+        self.counts: List[int] = [0] * len(commands)
+        self.times: List[float] = [0.0] * len(commands)
+        self._blocks = self._get_blocks(commands, graph)
+
+    def _get_blocks(self, commands: List[cmd.MiaCommand], graph: cfg.ControlFlowGraph) -> List[str]:
+        # A back edge closes its loop and every loop opened inside it
+        closes = {i: graph.calls[i] for i, _ in graph.back_edges()}
+        blocks = []
+        open_labels: List[str] = []
+        for i, com in enumerate(commands):
+            if isinstance(com, cmd.DefNameCmd):
+                open_labels.append(com._name)
+            blocks.append(open_labels[-1] if open_labels else MAIN_BLOCK)
+            label = closes.get(i)
+            if label in open_labels:
+                del open_labels[len(open_labels) - 1 - open_labels[::-1].index(label):]
+        return blocks
+
+    def instructions(self) -> List[Dict]:
+        rows = [
+            {
+                'index': i,
+                'line': com._t_cmd.line,
+                'cmd': com._t_cmd.string,
+                'block': self._blocks[i],
+                'count': self.counts[i],
+                'time': self.times[i],
+            }
+            for i, com in enumerate(self._commands)
+            if self.counts[i]
+        ]
+        return sorted(rows, key=lambda k: k['time'], reverse=True)
+
+    def blocks(self) -> List[Dict]:
+        blocks: Dict[str, Dict] = {}
+        for row in self.instructions():
+            block = blocks.setdefault(row['block'], {'block': row['block'], 'count': 0, 'time': 0.0})
+            block['count'] += row['count']
+            block['time'] += row['time']
+        return sorted(blocks.values(), key=lambda k: k['time'], reverse=True)
+
+    def to_dict(self) -> Dict:
+        return {
+            'total_count': sum(self.counts),
+            'total_time': sum(self.times),
+            'blocks': self.blocks(),
+            'instructions': self.instructions(),
+        }
+
+    def write_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def print_report(self, limit: int = 20):
+        total = sum(self.times) or 1.0
+
+        print('==================|PROFILE|==================')
+        print(f'{"block":<20} {"count":>10} {"time, ms":>10} {"%":>6}')
+        for row in self.blocks():
+            print(f'{row["block"]:<20} {row["count"]:>10} '
+                  f'{row["time"] * 1000:>10.3f} {row["time"] / total * 100:>6.1f}')
+        print()
+        print(f'{"line":>6} {"cmd":<10} {"block":<20} {"count":>10} {"time, ms":>10} {"%":>6}')
+        for row in self.instructions()[:limit]:
+            print(f'{row["line"]:>6} {row["cmd"]:<10} {row["block"]:<20} {row["count"]:>10} '
+                  f'{row["time"] * 1000:>10.3f} {row["time"] / total * 100:>6.1f}')
+        print('=============================================')
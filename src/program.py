@@ -0,0 +1,172 @@
+"""
+Встраивание интерпретатора: программа компилируется один раз
+и запускается сколько угодно раз, вывод возвращается списком строк
+
+    import program
+
+    prog = program.compile_string('alloc 0x1 10\nout 0x1')
+    result = prog.run()
+    result.output  # ['>>> 10']
+"""
+import io
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+# mia goes first: the command modules import it back
+from mia import Mia
+import bytecode
+import commands as cmd
+import errors
+import lexer
+import mem
+import output
+
+
+Value = Union[int, float]
+
+_ALLOC = cmd.CmdEnum.alloc.value
+_VAR = cmd.CmdEnum.var.value
+_ASSOC = cmd.CmdEnum.assoc.value
+_ARRAY = cmd.CmdEnum.array.value
+
+
+class EmbeddedMia(Mia):
+    """
+    Mia, которая вместо печати ошибки и `quit()`
+    бросает errors.ProgramError с текстом отчёта
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, writer=output.CaptureWriter(), **kwargs)
+        self._report = io.StringIO()
+
+    def _abort(self):
+        raise errors.ProgramError(self._report.getvalue())
+
+    def result(self) -> 'RunResult':
+        return RunResult(self._out.lines, self.get_registers(), self._memory)
+
+
+class RunResult(NamedTuple):
+    output: List[str]
+    registers: Dict[str, Union[Value, str]]
+    memory: mem.Memory
+
+
+def _target(instr: bytecode.Instr, symbols: Dict[str, int]) -> Optional[int]:
+    # Cell that `alloc`, `var` or `assoc` writes, None for other commands
+    if instr.op not in (_ALLOC, _VAR, _ASSOC):
+        return None
+    target = instr.args[0]
+    if target.address is not None:
+        return target.address
+    return symbols.get(target.string)
+
+
+def _seed(instrs: Tuple[bytecode.Instr, ...],
+          memory: Dict[mem.Ref, Value]) -> Tuple[List[bytecode.Instr], Dict[int, Value]]:
+    """
+    Ячейку, которую программа сама инициализирует, её команда затёрла
+    бы при запуске: значение подставляется в первую `alloc`/`var`
+    ячейки, а если их нет - `assoc` становится `var`. Остальные
+    ячейки возвращаются - их пишут в память до запуска
+    """
+    symbols: Dict[str, int] = {}
+    arrays = set()
+    for instr in instrs:
+        if instr.op in (_ASSOC, _VAR, _ARRAY) and instr.args[0].address is not None:
+            symbols.setdefault(instr.args[1].string, instr.args[0].address)
+            if instr.op == _ARRAY:
+                arrays.add(instr.args[0].address)
+
+    seeded = list(instrs)
+    cells: Dict[int, Value] = {}
+    for key, val in memory.items():
+        ref = symbols.get(key) if isinstance(key, str) else key
+        if ref is None:
+            raise ValueError(f'unknown name {key!r}')
+        if ref in arrays:
+            raise ValueError(f'cell {ref:#x} holds an array')
+
+        writes = [i for i, instr in enumerate(seeded) if _target(instr, symbols) == ref]
+        inits = [i for i in writes if seeded[i].op != _ASSOC] or writes
+        if not inits:
+            cells[ref] = val
+            continue
+        instr = seeded[inits[0]]
+        value = lexer.Operand(str(val), None, val)
+        if instr.op == _ALLOC:
+            seeded[inits[0]] = instr._replace(args=(instr.args[0], value))
+        else:
+            seeded[inits[0]] = instr._replace(op=_VAR, args=(*instr.args[:2], value))
+    return seeded, cells
+
+
+class Program(NamedTuple):
+    """
+    Скомпилированная программа, не меняется после компиляции
+    """
+    name: str
+    source: bytes
+    instrs: Tuple[bytecode.Instr, ...]
+
+    def start(self,
+              memory_size: int = 100,
+              memory: Optional[Dict[mem.Ref, Value]] = None,
+              registers: Optional[Dict[str, Union[Value, str]]] = None,
+              engine: str = 'classic',
+              optimize: bool = True,
+              hot_loops: bool = True,
+              fixed_width: bool = False) -> EmbeddedMia:
+        """
+        Готовый к запуску интерпретатор со своей памятью.
+        `memory` - начальные значения ячеек по адресу или имени: если
+        программа сама инициализирует ячейку, значение заменяет литерал
+        первой её `alloc`/`var` (см. `_seed`), ячейки массивов - ValueError,
+        `registers` - начальные значения регистров (`ax` или `_ax`),
+        `fixed_width` - арифметика int64/float64, как `--fixed-width`
+        """
+        mia = EmbeddedMia(
+            self.name,
+            memory_size,
+            use_cache=False,
+            engine=engine,
+            optimize=optimize,
+            hot_loops=hot_loops,
+            source=self.source,
+            fixed_width=fixed_width,
+        )
+        instrs, cells = _seed(self.instrs, memory or {})
+        for ref, val in cells.items():
+            mia.set_to_buffer(ref, val)
+        for name, val in (registers or {}).items():
+            mia.set_register('_' + name.lstrip('_'), val)
+
+        mia.load(instrs)
+        return mia
+
+    def run(self, memory_size: int = 100, **kwargs) -> RunResult:
+        """
+        Аргументы - как у `start()`
+        """
+        mia = self.start(memory_size, **kwargs)
+        mia.run()
+        return mia.result()
+
+
+def compile_bytes(source: bytes, name: str = '<bytes>') -> Program:
+    """
+    Ошибки в командах и их аргументах - errors.ProgramError
+    """
+    mia = EmbeddedMia(name, 2, use_cache=False, source=source)
+    lines = list(lexer.lex(source))
+    mia._create_cmd_list(lines)  # reports unknown commands and missing arguments
+    return Program(name, source, tuple(mia._to_bytecode(lines)))
+
+
+def compile_string(source: str, name: str = '<string>') -> Program:
+    return compile_bytes(source.encode('utf-8'), name)
+
+
+def compile_file(path: str) -> Program:
+    with open(path, 'rb') as f:
+        return compile_bytes(f.read(), path)
@@ -0,0 +1,233 @@
+import importlib.util
+import marshal
+import os
+from types import CodeType
+from typing import Dict, List, Optional
+
+import commands as cmd
+import errors
+import mem
+import mia
+import utils
+
+
+logger = utils.LazyImport('loguru', 'logger')  # traced runs only
+
+
+CACHE_EXT = '.miapy'
+MAGIC = b'MIAP'
+# Bump whenever the generated code changes: older .miapy files stop matching
+CODEGEN = 3
+
+FUNC_NAME = '_mia_program'
+
+# Registers that live in locals of the generated function
+_LOCAL_REGISTERS = {'_ax': 'ax', '_bx': 'bx', '_rx': 'rx'}
+
+# Commands that neither read nor write AX/BX/RX
+_NO_REGISTERS = (cmd.AssocCmd, cmd.VarCmd, cmd.ArrayCmd)
+
+_OPERATORS = {
+    cmd.SumCmd: '+',
+    cmd.SubCmd: '-',
+    cmd.MulCmd: '*',
+    cmd.DivCmd: '/',
+}
+
+# Division gives a float, the rest wraps to int64 in the fixed-width mode
+_WRAPPED = (cmd.SumCmd, cmd.SubCmd, cmd.MulCmd)
+
+
+class PyProgram:
+    """
+    Переводит программу в одну функцию на Python: блоки между
+    метками `defn` становятся ветками `if pc == ...` внутри `while`,
+    регистры AX/BX/RX - локальными переменными
+    """
+
+    def __init__(self, mia: 'mia.Mia', commands: List[cmd.MiaCommand]):
+        self._mia = mia
+        self._commands = commands
+        self._trace = self._is_traced()
+        self._namespace = self._get_namespace()
+
+    def _is_traced(self) -> bool:
+        # The trace lives in TraceMixin methods: a traced Mia runs every command's `do()`
+        return isinstance(self._mia, mia.TraceMixin)
+
+    def _get_namespace(self) -> Dict[str, object]:
+        m = self._mia
+        namespace = {
+            'm': m,
+            'def_names': m._def_names,
+            'print_val': m.print_val,
+            'print_ref_val': m.print_ref_val,
+            'AssociatedAddressError': errors.AssociatedAddressError,
+            'wrap': mem.wrap_int64,
+        }
+        if self._trace:
+            namespace['log'] = logger.debug
+        # Bound operands and the commands themselves, by command index
+        for i, com in enumerate(self._commands):
+            namespace[f'c{i}'] = com
+            for attr in ('_src', '_dst', '_value', '_label'):
+                val = getattr(com, attr, None)
+                if val is not None:
+                    namespace[f'{attr[1]}{i}'] = val
+            if isinstance(com, cmd.FusedArithCmd):
+                namespace[f'a{i}'] = com._ax_src
+                namespace[f'b{i}'] = com._bx_src
+        return namespace
+
+    def _block_starts(self) -> List[int]:
+        # A jump to `defn` resumes right after it
+        return self._mia.get_cfg().entry_points()
+
+    def _read(self, ref: Optional[mem.Ref], reader: str) -> str:
+        # Expression for a source operand
+        if isinstance(ref, str) and ref in _LOCAL_REGISTERS:
+            return _LOCAL_REGISTERS[ref]
+        if isinstance(ref, str) and self._mia._is_register_name(ref):
+            return f'm.{ref}'
+        return f'{reader}()'
+
+    def _arith(self, t: type) -> str:
+        if self._mia._fixed_width and t in _WRAPPED:
+            return f'rx = wrap(ax {_OPERATORS[t]} bx)'
+        return f'rx = ax {_OPERATORS[t]} bx'
+
+    def _fallback(self, i: int) -> List[str]:
+        return [
+            'm._ax, m._bx, m._rx = ax, bx, rx',
+            f'c{i}.do()',
+            'ax, bx, rx = m._ax, m._bx, m._rx',
+        ]
+
+    def _translate_traced(self, i: int, com: cmd.MiaCommand) -> List[str]:
+        # Same calls and log lines as the classic loop
+        lines = [f'm._cmd_index = {i}', f'log(c{i}.__class__)'] + self._fallback(i)
+        if isinstance(com, cmd.CallDefNameCmd):
+            lines += [f'if m._cmd_index != {i}:', '    pc = m._cmd_index + 1', '    continue']
+        return lines
+
+    def _translate(self, i: int, com: cmd.MiaCommand) -> List[str]:
+        if self._trace:
+            return self._translate_traced(i, com)
+        t = type(com)
+
+        if t is cmd.RegAxCmd:
+            return [f'ax = {self._read(com._ref, f"s{i}")}']
+        if t is cmd.RegBxCmd:
+            return [f'bx = {self._read(com._ref, f"s{i}")}']
+        if t in _OPERATORS:
+            return [self._arith(t), f'd{i}(rx)']
+        if t is cmd.FusedArithCmd:
+            lines = []
+            if com._ax_cmd is not None:
+                lines.append(f'ax = {self._read(com._ax_cmd._ref, f"a{i}")}')
+            if com._bx_cmd is not None:
+                lines.append(f'bx = {self._read(com._bx_cmd._ref, f"b{i}")}')
+            lines += [self._arith(type(com._op_cmd)), f'd{i}(rx)']
+            return lines
+        if t is cmd.OutCmd:
+            return [f'print_val({self._read(com._ref, f"s{i}")})']
+        if t is cmd.OutFCmd:
+            return [f'print_ref_val(l{i}, {self._read(com._ref, f"s{i}")})']
+        if t is cmd.AllocCmd:
+            return [
+                'try:',
+                f'    d{i}(v{i})',
+                'except AssociatedAddressError:',
+                f'    c{i}.do()  # reports the error',
+            ]
+        if t in _NO_REGISTERS:
+            return [f'c{i}.do()']
+        if t is cmd.DefNameCmd:
+            return [f'def_names[{com._name!r}] = {i}']
+        if t is cmd.CallDefNameCmd:
+            cond = 'rx' if com._ref is None else self._read(com._ref, f's{i}')
+            if com._target is None:
+                jump = f'pc = def_names[{com._name!r}] + 1'
+            else:
+                jump = f'pc = {com._target + 1}'
+            return [f'if {cond} > 0:', f'    {jump}', '    continue']
+        return self._fallback(i)
+
+    def source(self) -> str:
+        commands = self._commands
+        n = len(commands)
+        starts = self._block_starts()
+
+        out = [
+            f'def {FUNC_NAME}():',
+            '    ax, bx, rx = m._ax, m._bx, m._rx',
+            '    pc = m._cmd_index',
+            '    while True:',
+        ]
+        for k, start in enumerate(starts):
+            end = starts[k + 1] if k + 1 < len(starts) else n
+            out.append(f'        if pc == {start}:')
+            for i in range(start, end):
+                out.append(f'            # {i}: line {commands[i]._t_cmd.line} {commands[i]._t_cmd.string}')
+                out += [f'            {line}' for line in self._translate(i, commands[i])]
+            # Fall through into the next block
+            out.append(f'            pc = {end}')
+        out += [
+            '        break',
+            f'    m._ax, m._bx, m._rx, m._cmd_index = ax, bx, rx, {n}',
+            '',
+        ]
+        return '\n'.join(out)
+
+    def compile(self) -> CodeType:
+        return compile(self.source(), f'<mia {self._mia._filename}>', 'exec')
+
+    def run(self, code: CodeType):
+        m = self._mia
+        if m._cmd_index != 0 and m._cmd_index not in self._block_starts():
+            raise ValueError(f'cannot start at command {m._cmd_index}')
+        exec(code, self._namespace)
+        self._namespace[FUNC_NAME]()
+
+
+def cache_path(filename: str) -> str:
+    return os.path.splitext(filename)[0] + CACHE_EXT
+
+
+def _cache_key(version: str, digest: bytes, optimize: bool, fixed_width: bool, trace: bool) -> bytes:
+    # Marshalled code is only valid for the Python version that wrote it
+    return (MAGIC + CODEGEN.to_bytes(2, 'little') + importlib.util.MAGIC_NUMBER
+            + version.encode() + digest + bytes([optimize, fixed_width, trace]))
+
+
+def read_cache(filename: str, version: str, digest: bytes, optimize: bool,
+               fixed_width: bool = False, trace: bool = False) -> Optional[CodeType]:
+    key = _cache_key(version, digest, optimize, fixed_width, trace)
+    try:
+        with open(cache_path(filename), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(key):
+        return None
+    try:
+        return marshal.loads(data[len(key):])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def write_cache(filename: str, code: CodeType, version: str, digest: bytes, optimize: bool,
+                fixed_width: bool = False, trace: bool = False):
+    path = cache_path(filename)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(_cache_key(version, digest, optimize, fixed_width, trace))
+            f.write(marshal.dumps(code))
+        os.replace(tmp, path)
+    except OSError:
+        # Same as the bytecode cache: failing to write it is not an error
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
@@ -0,0 +1,110 @@
+"""
+Кооперативный запуск многих программ в одном процессе:
+каждая программа выполняет не больше `slice_size` команд
+и уступает очередь следующей
+
+    sched = scheduler.Scheduler(slice_size=1000)
+    tasks = [sched.add(prog) for prog in programs]
+    sched.run()                      # или: await sched.run_async()
+    tasks[0].result.output
+"""
+import asyncio
+from collections import deque
+from typing import Deque, List, Optional
+
+import program
+
+
+SLICE_SIZE = 1000
+
+
+class Task:
+    """
+    Одна запущенная программа. После завершения заполнено
+    `result` или `error` (errors.ProgramError и прочие исключения)
+    """
+
+    def __init__(self, name: str, vm: 'program.EmbeddedMia'):
+        self.name = name
+        self.result: Optional[program.RunResult] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.instructions = 0
+        self.slices = 0
+        self._vm = vm
+
+    def step(self, budget: int) -> bool:
+        """
+        Выполняет один квант, True - задача завершилась
+        """
+        if self.done:
+            return True
+        self.slices += 1
+        try:
+            self.instructions += self._vm.run_slice(budget)
+            finished = self._vm.is_finished()
+        except Exception as e:
+            self.error = e
+            finished = True
+        if finished:
+            self.done = True
+            if self.error is None:
+                self.result = self._vm.result()
+            self._vm = None  # free the interpreter, only the result is kept
+        return finished
+
+
+class Scheduler:
+    """
+    Циклическая очередь задач с одинаковым квантом команд
+    """
+
+    def __init__(self, slice_size: int = SLICE_SIZE):
+        assert slice_size > 0
+        self._slice_size = slice_size
+        self._queue: Deque[Task] = deque()
+        self.tasks: List[Task] = []
+
+    def add(self, prog: 'program.Program', name: Optional[str] = None, **kwargs) -> Task:
+        """
+        `kwargs` - как у `Program.start()`. Квантование работает
+        только на движке classic без специализации циклов
+        """
+        kwargs.update(engine='classic', hot_loops=False)
+        task = Task(name or prog.name, prog.start(**kwargs))
+        self._queue.append(task)
+        self.tasks.append(task)
+        return task
+
+    def step(self) -> bool:
+        """
+        Один квант первой задачи в очереди, False - очередь пуста
+        """
+        if not self._queue:
+            return False
+        task = self._queue.popleft()
+        if not task.step(self._slice_size):
+            self._queue.append(task)
+        return True
+
+    def run(self):
+        while self.step():
+            pass
+
+    async def run_async(self):
+        # Give the event loop a turn between slices
+        while self.step():
+            await asyncio.sleep(0)
+
+
+async def run_cooperative(prog: 'program.Program', slice_size: int = SLICE_SIZE, **kwargs) -> 'program.RunResult':
+    """
+    Запуск одной программы внутри asyncio, уступая циклу событий
+    каждые `slice_size` команд
+    """
+    task = Scheduler(slice_size).add(prog, **kwargs)
+    while not task.step(slice_size):
+        await asyncio.sleep(0)
+    if task.error is not None:
+        raise task.error
+    return task.result
@@ -0,0 +1,224 @@
+"""
+Снимок полного состояния интерпретатора: ячейки памяти,
+ассоциации, массивы, регистры, `_cmd_index` и `_def_names`
+
+Формат: заголовок (MAGIC, версия формата, длина метаданных),
+метаданные в JSON и выровненные по 8 байт двоичные блоки:
+    kinds   uint8[n]  - тип каждой ячейки (None/int/float/прочее)
+    ints    int64[]   - значения целых ячеек подряд
+    floats  float64[] - значения дробных ячеек подряд
+    и по блоку на каждый массив с буфером int64/float64
+
+Блоки читаются через mmap без копирования и без pickle
+"""
+import json
+import mmap
+import os
+import struct
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import errors
+import mem
+
+
+MAGIC = b'MIAS'
+FORMAT = 1
+
+_HEADER = struct.Struct('<4sHQ')
+_ALIGN = 8
+
+KIND_NONE = 0
+KIND_INT = 1
+KIND_FLOAT = 2
+KIND_OTHER = 3  # big ints and anything else, kept in the metadata
+
+_KINDS = defaultdict(lambda: KIND_OTHER, {type(None): KIND_NONE, int: KIND_INT, float: KIND_FLOAT})
+
+
+def _pad(size: int) -> int:
+    return -size % _ALIGN
+
+
+def _to_json(val):
+    # NumPy scalars may come from the array registers
+    return val.item() if isinstance(val, np.generic) else val
+
+
+class _Blobs:
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def add(self, values: np.ndarray) -> Dict:
+        data = values.tobytes()
+        desc = {'offset': self.size, 'dtype': values.dtype.str, 'count': len(values)}
+        self.chunks.append(data)
+        self.chunks.append(b'\0' * _pad(len(data)))
+        self.size += len(data) + _pad(len(data))
+        return desc
+
+
+def _encode_cells(cells: List, blobs: _Blobs) -> Dict:
+    n = len(cells)
+    kinds = np.fromiter(map(_KINDS.__getitem__, map(type, cells)), dtype=np.uint8, count=n)
+    values = np.fromiter(cells, dtype=object, count=n)
+
+    ints = values[kinds == KIND_INT]
+    try:
+        ints = ints.astype(np.int64)
+    except OverflowError:
+        # Python ints are unbounded: the ones past int64 go to the metadata
+        big = (ints < mem.INT64_MIN) | (ints > mem.INT64_MAX)
+        kinds[np.flatnonzero(kinds == KIND_INT)[big]] = KIND_OTHER
+        ints = ints[~big].astype(np.int64)
+    floats = values[kinds == KIND_FLOAT].astype(np.float64)
+    other = [[int(i), _to_json(cells[i])] for i in np.flatnonzero(kinds == KIND_OTHER)]
+
+    return {
+        'kinds': blobs.add(kinds),
+        'ints': blobs.add(ints),
+        'floats': blobs.add(floats),
+        'other': other,
+    }
+
+
+def _encode_owners(refs: Dict[int, mem.AssocRef],
+                   arrays: Dict[str, mem.ArrayRef],
+                   blobs: _Blobs) -> Tuple[List, Dict, Dict]:
+    # An array may be reachable by its cell, by its name or both:
+    # every owner object is stored once and referenced by its index
+    owners = []
+    ids: Dict[int, int] = {}
+
+    def add(owner: mem.AssocRef) -> int:
+        key = id(owner)
+        if key not in ids:
+            ids[key] = len(owners)
+            desc = {'ref': owner._ref, 'name': owner._name}
+            if isinstance(owner, mem.ArrayRef):
+                values = owner._values
+                if values.dtype.kind == 'O':
+                    desc['list'] = [_to_json(k) for k in values.tolist()]
+                else:
+                    desc['values'] = blobs.add(values)
+            owners.append(desc)
+        return ids[key]
+
+    ref_ids = {str(ref): add(owner) for ref, owner in refs.items()}
+    array_ids = {name: add(array) for name, array in arrays.items()}
+    return owners, ref_ids, array_ids
+
+
+def encode(mia, meta: Dict) -> List[bytes]:
+    cells, symbols, refs, arrays = mia._memory.get_state()
+    blobs = _Blobs()
+
+    meta['registers'] = {k: _to_json(v) for k, v in mia.get_registers().items()}
+    meta['cmd_index'] = mia._cmd_index
+    meta['def_names'] = mia._def_names
+    meta['cells'] = _encode_cells(cells, blobs)
+    meta['symbols'] = symbols
+    meta['owners'], meta['refs'], meta['arrays'] = _encode_owners(refs, arrays, blobs)
+
+    data = json.dumps(meta, separators=(',', ':')).encode()
+    head = _HEADER.pack(MAGIC, FORMAT, len(data)) + data
+    return [head, b'\0' * _pad(len(head))] + blobs.chunks
+
+
+def write_snapshot(mia, path: str):
+    """
+    Запись атомарная: прерванный запуск оставляет предыдущий снимок целым
+    """
+    meta = {
+        'version': mia.V,
+        'digest': mia._digest.hex(),
+        'optimize': mia._optimize,
+        'fixed_width': mia._memory.is_fixed_width(),
+    }
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.writelines(encode(mia, meta))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _view(buf: mmap.mmap, base: int, desc: Dict) -> np.ndarray:
+    return np.frombuffer(buf, dtype=np.dtype(desc['dtype']),
+                         count=desc['count'], offset=base + desc['offset'])
+
+
+def _decode_cells(buf: mmap.mmap, base: int, desc: Dict) -> List:
+    kinds = _view(buf, base, desc['kinds'])
+    values = np.empty(len(kinds), dtype=object)  # all None
+    values[kinds == KIND_INT] = _view(buf, base, desc['ints'])
+    values[kinds == KIND_FLOAT] = _view(buf, base, desc['floats'])
+    for i, val in desc['other']:
+        values[i] = val
+    return values.tolist()
+
+
+def _decode_owner(buf: mmap.mmap, base: int, desc: Dict, cells: List, fixed: bool) -> mem.AssocRef:
+    if 'values' in desc:
+        # Copy-on-write pages: the program may change the array freely
+        values = _view(buf, base, desc['values'])
+        return mem.ArrayRef.from_values(desc['ref'], desc['name'], values, fixed)
+    if 'list' in desc:
+        values = np.array(desc['list'], dtype=object)
+        return mem.ArrayRef.from_values(desc['ref'], desc['name'], values, fixed)
+    return mem.AssocRef(desc['ref'], desc['name'], cells)
+
+
+def read_meta(buf: mmap.mmap) -> Tuple[Dict, int]:
+    magic, fmt, size = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or fmt != FORMAT:
+        raise errors.SnapshotError('not a snapshot of this format')
+    meta = json.loads(buf[_HEADER.size:_HEADER.size + size])
+    base = _HEADER.size + size
+    return meta, base + _pad(base)
+
+
+def read_snapshot(mia, path: str):
+    """
+    Восстанавливает состояние в уже загруженной (`load()`) программе
+    """
+    with open(path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            meta, base = read_meta(buf)
+        except (struct.error, ValueError):
+            # ValueError: an empty file or broken JSON
+            raise errors.SnapshotError('not a snapshot of this format')
+
+    if meta['version'] != mia.V:
+        raise errors.SnapshotError(f'written by interpreter version {meta["version"]}')
+    if meta['digest'] != mia._digest.hex():
+        raise errors.SnapshotError('written for a different source file')
+    if meta['optimize'] != mia._optimize:
+        # Superinstructions change the command indexes
+        raise errors.SnapshotError('written with a different --no-opt setting')
+    if meta['fixed_width'] != mia._memory.is_fixed_width():
+        raise errors.SnapshotError('written with a different --fixed-width setting')
+
+    cells = _decode_cells(buf, base, meta['cells'])
+    fixed = mia._memory.is_fixed_width()
+    owners = [_decode_owner(buf, base, k, cells, fixed) for k in meta['owners']]
+    mia._memory.set_state(
+        cells,
+        meta['symbols'],
+        {int(ref): owners[i] for ref, i in meta['refs'].items()},
+        {name: owners[i] for name, i in meta['arrays'].items()},
+    )
+
+    for name, val in meta['registers'].items():
+        mia.set_register(name, val)
+    mia._cmd_index = meta['cmd_index']
+    mia._def_names = meta['def_names']
@@ -0,0 +1,121 @@
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import commands as cmd
+import lexer
+import mia
+
+
+DEFAULT_WINDOW = 4096
+
+
+class StreamProgram:
+    """
+    Программа, которая читается из файла по ходу выполнения.
+    В памяти держатся только адреса меток `defn` в файле
+    и окно из последних `window` скомпилированных команд
+    """
+
+    def __init__(self, mia: 'mia.Mia', filename: str, window: int = DEFAULT_WINDOW):
+        assert window > 0
+        self._mia = mia
+        self._filename = filename
+        self._window = window
+        self._commands: 'OrderedDict[int, cmd.MiaCommand]' = OrderedDict()
+
+        # Positions a read can restart from: (cmd_index, byte offset, line number).
+        # Jumps only land on `defn` lines, so those are the only ones kept.
+        self._checkpoints: List[Tuple[int, int, int]] = [(0, 0, 1)]
+        self._checkpoint_indexes: List[int] = [0]
+
+        self._file: Optional[BinaryIO] = None
+        self._next_index = 0
+        self._next_line = 1
+
+    def _read_lines(self, f: BinaryIO, first_line: int, offsets: Optional['array[int]'] = None):
+        # Yields (byte offset, line number, tokens) for every non-empty line
+        i_line = first_line
+        while True:
+            offset = f.tell()
+            data = f.readline()
+            if not data:
+                return
+            if offsets is not None:
+                offsets.append(offset)
+            if offset == 0 and data.startswith(b'\xef\xbb\xbf'):
+                data = data[3:]
+            tokens = lexer.lex_line(data.decode('utf-8'), i_line)
+            if tokens:
+                yield offset, i_line, tokens
+            i_line += 1
+
+    def scan(self) -> Dict[str, List[int]]:
+        """
+        Первый проход: проверяет команды и их аргументы
+        и запоминает, где в файле стоит каждый `defn`
+        """
+        def_indexes: Dict[str, List[int]] = {}
+        offsets = array('Q')
+        # Errors found by the scan already render through the source map
+        self._mia.set_source_map(lexer.SourceMap(self._filename, offsets))
+        with open(self._filename, 'rb') as f:
+            for i, (offset, i_line, line) in enumerate(self._read_lines(f, 1, offsets)):
+                # Building the command reports keyword and argument errors
+                # before anything runs, as the in-memory mode does
+                self._mia._create_cmd(line, i)
+                if line[0].string == cmd.CmdEnum.defn.name:
+                    def_indexes.setdefault(line[1].string, []).append(i)
+                    self._checkpoints.append((i, offset, i_line))
+                    self._checkpoint_indexes.append(i)
+        return def_indexes
+
+    def _seek(self, index: int):
+        pos = bisect_right(self._checkpoint_indexes, index) - 1
+        start, offset, i_line = self._checkpoints[pos]
+        if start <= self._next_index <= index:
+            return  # reading on from the current position is closer
+        self._file.seek(offset)
+        self._next_index = start
+        self._next_line = i_line
+
+    def _read_next(self) -> Optional[cmd.MiaCommand]:
+        for _, i_line, line in self._read_lines(self._file, self._next_line):
+            com = self._mia._create_cmd(line, self._next_index)
+            com.bind()
+            com.release_tokens()
+            self._next_index += 1
+            self._next_line = i_line + 1
+            return com
+        return None
+
+    def get(self, index: int) -> Optional[cmd.MiaCommand]:
+        commands = self._commands
+        com = commands.get(index)
+        if com is not None:
+            commands.move_to_end(index)
+            return com
+
+        if self._file is None:
+            self._file = open(self._filename, 'rb')
+        if index != self._next_index:
+            self._seek(index)
+        while True:
+            i = self._next_index
+            com = self._read_next()
+            if com is None:
+                return None  # end of the program
+            commands[i] = com
+            if len(commands) > self._window:
+                commands.popitem(last=False)
+            if i == index:
+                return com
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self) -> int:
+        return len(self._commands)
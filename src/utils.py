@@ -1,27 +1,93 @@
-from pprint import pformat, pprint
-from typing import Dict, List, Union
-import numpy as np
-from queue import LifoQueue
-import tokenize
-from tokenize import NEWLINE, ENDMARKER, TokenInfo
+from contextlib import contextmanager
+import gc
+import importlib
+from typing import Any, Callable, Iterator, Optional, Union
 
-from abc import ABC, abstractmethod 
-  
-from loguru import logger
+import itertools
 
-import re
+from lexer import Operand, Token
 
 
-def to_number_value(t: TokenInfo) -> Union[int, float]:
-    if re.match(r'^-?\d+(?:\.\d+)$', t.string) is not None:
-        return float(t.string)
-    if t.string.isdecimal:
-        return int(t.string)
-    raise TypeError('NOT NUMBER')
+class LazyImport:
+    """
+    Модуль (или его атрибут), который импортируется при первом
+    обращении: NumPy нужен только массивам, loguru - только трассировке
 
+        np = LazyImport('numpy')
+        logger = LazyImport('loguru', 'logger')
+    """
 
-def to_ref(t: TokenInfo) -> str:
-    return hex(int(t.string, 16))
+    def __init__(self, module: str, attr: Optional[str] = None):
+        self._lazy_module = module
+        self._lazy_attr = attr
 
-def is_hex_ref(t: TokenInfo) -> bool:
-    return t.string.startswith('0x')
\ No newline at end of file
+    def __getattr__(self, name: str):
+        # Only called for names not cached in the instance yet
+        target = importlib.import_module(self._lazy_module)
+        if self._lazy_attr is not None:
+            target = getattr(target, self._lazy_attr)
+        value = getattr(target, name)
+        setattr(self, name, value)
+        return value
+
+
+def _is_float_literal(s: str) -> bool:
+    # Same as r'^-?\d+\.\d+$', without the regex engine
+    whole, dot, frac = s.partition('.')
+    if whole.startswith('-'):
+        whole = whole[1:]
+    return bool(dot) and whole.isdecimal() and frac.isdecimal()
+
+
+def _parse_number(s: str) -> Union[int, float]:
+    if _is_float_literal(s):
+        return float(s)
+    return int(s)
+
+
+def to_operand(s: str) -> Operand:
+    address = number = None
+    try:
+        if s.startswith('0x'):
+            address = int(s, 16)
+        else:
+            number = _parse_number(s)
+    except ValueError:
+        pass
+    return Operand(s, address, number)
+
+
+def to_number_value(t: Union[Token, Operand]) -> Union[int, float]:
+    if type(t) is Operand:
+        if t.number is None:
+            raise ValueError(t.string)
+        return t.number
+    return _parse_number(t.string)
+
+
+def to_address(t: Union[Token, Operand]) -> int:
+    if type(t) is Operand and t.address is not None:
+        return t.address
+    return int(t.string, 16)
+
+def is_hex_ref(t: Union[Token, Operand]) -> bool:
+    return t.string.startswith('0x')
+
+
+def constant(val) -> Callable[[], Any]:
+    return itertools.repeat(val).__next__
+
+
+@contextmanager
+def paused_gc() -> Iterator[None]:
+    """
+    Без сборки циклов: всё, что создаётся внутри, живёт до конца
+    программы, и проходы сборщика по нему ничего не находят
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
@@ -0,0 +1,201 @@
+from typing import List, Optional, Tuple
+
+import commands as cmd
+import errors
+import mem
+import mia
+import utils
+
+
+logger = utils.LazyImport('loguru', 'logger')  # traced runs only
+
+
+OP_ALLOC = cmd.CmdEnum.alloc.value
+OP_OUT = cmd.CmdEnum.out.value
+OP_AX = cmd.CmdEnum.ax.value
+OP_BX = cmd.CmdEnum.bx.value
+OP_SUM = cmd.CmdEnum.sum.value
+OP_SUB = cmd.CmdEnum.sub.value
+OP_DIV = cmd.CmdEnum.div.value
+OP_MUL = cmd.CmdEnum.mul.value
+OP_OUTF = cmd.CmdEnum.outf.value
+OP_DEFN = cmd.CmdEnum.defn.value
+OP_CALL = cmd.CmdEnum.call.value
+OP_ASSOC = cmd.CmdEnum.assoc.value
+OP_VAR = cmd.CmdEnum.var.value
+# Everything else runs through the command's own `do()`
+OP_CMD = -1
+# Superinstructions from the peephole pass, not source commands
+OP_ADD3 = -2
+OP_SUB3 = -3
+OP_MUL3 = -4
+OP_DIV3 = -5
+
+_FUSED_OPCODES = {
+    cmd.SumCmd: OP_ADD3,
+    cmd.SubCmd: OP_SUB3,
+    cmd.MulCmd: OP_MUL3,
+    cmd.DivCmd: OP_DIV3,
+}
+
+_CMD_OPCODES = {v: k.value for k, v in cmd.CMD_MAPPING.items()}
+
+# Integer results of these wrap to int64 in the fixed-width mode: there
+# they run through the command's `do()` and FixedWidthMixin
+_WRAPPED_OPS = (OP_SUM, OP_SUB, OP_MUL)
+
+# Commands whose single source operand is a memory read.
+# A register operand (`out _arxv`) keeps these on the `do()` path.
+_SOURCE_OPS = (OP_OUT, OP_OUTF, OP_AX, OP_BX)
+
+Instr = Tuple[int, object, object, object]
+
+
+class MiaVM:
+    """
+    Исполняет программу как плоский массив инструкций
+    с целыми опкодами, держа регистры AX/BX/RX в локальных переменных
+    """
+
+    def __init__(self, mia: 'mia.Mia', commands: List[cmd.MiaCommand]):
+        self._mia = mia
+        self._code: List[Instr] = [self._translate(k) for k in commands]
+
+    def _is_memory_ref(self, ref: Optional['mem.Ref']) -> bool:
+        return ref is not None and not self._mia._is_register_name(ref)
+
+    def _translate_fused(self, com: cmd.FusedArithCmd) -> Instr:
+        # Register operands are read from the Mia object, which the VM
+        # does not keep in sync, so those stay on the `do()` path
+        for part in (com._ax_cmd, com._bx_cmd):
+            if part is not None and not self._is_memory_ref(part._ref):
+                return (OP_CMD, com, None, None)
+        if self._mia._fixed_width and not isinstance(com._op_cmd, cmd.DivCmd):
+            return (OP_CMD, com, None, None)
+        return (_FUSED_OPCODES[type(com._op_cmd)], com._ax_src, com._bx_src, com._dst)
+
+    def _translate(self, com: cmd.MiaCommand) -> Instr:
+        # The trace lives in TraceMixin methods, which the inlined opcodes skip
+        if isinstance(self._mia, mia.TraceMixin):
+            return (OP_CMD, com, None, None)
+        if isinstance(com, cmd.FusedArithCmd):
+            return self._translate_fused(com)
+        
+        # Operands are the readers/writers already bound by `bind()`
+        op = _CMD_OPCODES[type(com)]
+
+        if op == OP_ALLOC:
+            return (op, com._dst, com._value, com)
+        if op == OP_OUTF and self._is_memory_ref(com._ref):
+            return (op, com._src, com._label, com)
+        if op in _SOURCE_OPS and self._is_memory_ref(com._ref):
+            return (op, com._src, None, com)
+        if op in _WRAPPED_OPS and self._mia._fixed_width:
+            return (OP_CMD, com, None, None)
+        if op in (OP_SUM, OP_SUB, OP_MUL, OP_DIV):
+            return (op, com._dst, None, com)
+        if op == OP_DEFN:
+            return (op, com._name, None, com)
+        if op == OP_CALL and (com._ref is None or self._is_memory_ref(com._ref)):
+            return (op, com._name, com._src, com._target)
+        if op == OP_ASSOC:
+            return (op, com._ref, com._name, com)
+        if op == OP_VAR:
+            return (op, com._ref, com._name, com._value)
+        return (OP_CMD, com, None, None)
+
+    def run(self):
+        m = self._mia
+        code = self._code
+        n = len(code)
+
+        memory = m._memory
+        set_var = memory.set_var
+        create_assoc = memory.create_assoc
+        def_names = m._def_names
+        print_val = m.print_val
+        print_ref_val = m.print_ref_val
+        trace = isinstance(m, mia.TraceMixin)
+
+        ax = m._ax
+        bx = m._bx
+        rx = m._rx
+        i = m._cmd_index
+
+        while i < n:
+            op, a, b, c = code[i]
+
+            if op == OP_ADD3:
+                if a is not None:
+                    ax = a()
+                if b is not None:
+                    bx = b()
+                rx = ax + bx
+                c(rx)
+            elif op == OP_SUB3:
+                if a is not None:
+                    ax = a()
+                if b is not None:
+                    bx = b()
+                rx = ax - bx
+                c(rx)
+            elif op == OP_MUL3:
+                if a is not None:
+                    ax = a()
+                if b is not None:
+                    bx = b()
+                rx = ax * bx
+                c(rx)
+            elif op == OP_AX:
+                ax = a()
+            elif op == OP_BX:
+                bx = a()
+            elif op == OP_SUM:
+                rx = ax + bx
+                a(rx)
+            elif op == OP_SUB:
+                rx = ax - bx
+                a(rx)
+            elif op == OP_MUL:
+                rx = ax * bx
+                a(rx)
+            elif op == OP_CALL:
+                val = rx if b is None else b()
+                if val > 0:
+                    i = def_names[a] if c is None else c
+            elif op == OP_OUT:
+                print_val(a())
+            elif op == OP_ALLOC:
+                try:
+                    a(b)
+                except errors.AssociatedAddressError:
+                    m._ax, m._bx, m._rx, m._cmd_index = ax, bx, rx, i
+                    m.print_assoc_address_error(c._t_cmd, c._ref)
+            elif op == OP_DEFN:
+                def_names[a] = i
+            elif op == OP_DIV:
+                rx = ax / bx
+                a(rx)
+            elif op == OP_DIV3:
+                if a is not None:
+                    ax = a()
+                if b is not None:
+                    bx = b()
+                rx = ax / bx
+                c(rx)
+            elif op == OP_OUTF:
+                print_ref_val(b, a())
+            elif op == OP_ASSOC:
+                create_assoc(a, b)
+            elif op == OP_VAR:
+                create_assoc(a, b)
+                set_var(b, c)
+            else:
+                m._ax, m._bx, m._rx, m._cmd_index = ax, bx, rx, i
+                if trace:
+                    logger.debug(a.__class__)
+                a.do()
+                ax, bx, rx, i = m._ax, m._bx, m._rx, m._cmd_index
+            i += 1
+
+        m._ax, m._bx, m._rx, m._cmd_index = ax, bx, rx, i